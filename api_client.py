@@ -1,62 +1,603 @@
 import os
-import google.generativeai as genai
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from typing import Callable, Iterator, Optional, Sequence, Tuple, Union
+
+# google.generativeai takes about a second to import, so it is only imported when a model is
+# first configured (see shared_model / GeminiAPIClient.load_model), off the UI thread in the app.
+from config import data_dir, env_flag, env_float, env_int
+from context_cache import ContextCache, prefix_of
+from metrics import LatencyTracker, estimate_tokens, get_recorder
+from response_cache import ResponseCache
+
+
+NOT_CONFIGURED_MESSAGE = (
+    "API key not configured. Please set the GENAI_API_KEY environment variable "
+    "and restart the app."
+)
+
+# Error kinds, see classify_error
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+_RETRY_HINT_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+)
+
+
+class GeminiAPIError(Exception):
+    def __init__(self, message: str, kind: str = FATAL, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in (RATE_LIMIT, TRANSIENT)
+
+    @classmethod
+    def from_exception(cls, exc: Exception) -> "GeminiAPIError":
+        if isinstance(exc, cls):
+            return exc
+        error = cls(f"An error occurred:\n{exc}", classify_error(exc), retry_after_hint(exc))
+        error.__cause__ = exc
+        return error
+
+
+def classify_error(exc: Exception) -> str:
+    """Sort an API exception into RATE_LIMIT, TRANSIENT (worth retrying) or FATAL."""
+    # Google API errors can only exist once the SDK has been imported
+    google_exceptions = sys.modules.get("google.api_core.exceptions")
+    code = getattr(exc, "code", None)
+    if google_exceptions and isinstance(exc, google_exceptions.GoogleAPICallError):
+        code = exc.code
+    if code == 429:
+        return RATE_LIMIT
+    if code in (408, 500, 502, 503, 504):
+        return TRANSIENT
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    if google_exceptions and isinstance(exc, google_exceptions.RetryError):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_after_hint(exc: Exception) -> Optional[float]:
+    """Server-suggested delay in seconds, from RetryInfo details or the error text."""
+    for detail in getattr(exc, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(str(exc))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+# Models are configured once per (key, model name) and shared by every client and thread,
+# so all requests reuse the same underlying connection pool.
+_models = {}
+_models_lock = threading.Lock()
+
+
+def shared_model(api_key: str, model_name: str):
+    with _models_lock:
+        key = (api_key, model_name)
+        if key not in _models:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _models[key] = genai.GenerativeModel(model_name)
+        return _models[key]
 
 
 class GeminiAPIClient:  # Interacts with Gemini API
-    def __init__(self):
+    # Hedging waits for at least this many samples and never fires sooner than HEDGE_MIN_DELAY seconds
+    HEDGE_MIN_SAMPLES = 20
+    HEDGE_MIN_DELAY = 1.0
+
+    def __init__(self, load_model: bool = True):
+        """With load_model=False the SDK import and model setup are left to load_model(), which
+        the first request also triggers; the app runs it on a background thread at startup."""
         self.api_key = os.environ.get("GENAI_API_KEY")
         self.model_name = os.environ.get("MODEL_NAME")
         self.model = None
-        if genai and self.api_key:
-            try:
-                genai.configure(api_key=self.api_key)
-                self.model = genai.GenerativeModel(self.model_name)
-            except Exception:
-                self.model = None
+        self.model_error = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()
+        # Builds the model for any other name passed per call (routing, fan-out)
+        self.model_factory = lambda name: shared_model(self.api_key, name)
+        self.cache = self._create_cache()
+        self.context_cache = self._create_context_cache()
+
+        self.max_attempts = max(1, env_int("API_MAX_ATTEMPTS", 4))
+        self.backoff_base = env_float("API_BACKOFF_BASE", 1.0)
+        self.backoff_max = env_float("API_BACKOFF_MAX", 30.0)
+        self.call_timeout = env_float("API_CALL_TIMEOUT", 120) or None
+        self.hedge = env_flag("API_HEDGE", False)
+        self.latency = LatencyTracker()
+        self.first_chunk_latency = LatencyTracker()
+        self._trackers = {}
+        self._trackers_lock = threading.Lock()
+        self.metrics = get_recorder()
+        if load_model:
+            self.load_model()
+
+    @property
+    def model_loaded(self) -> bool:
+        return self._model_loaded
+
+    def load_model(self):
+        """Import the SDK and configure the default model once; returns it, or None without a key."""
+        if self._model_loaded:
+            return self.model
+        with self._model_lock:
+            if not self._model_loaded:
+                if self.api_key:
+                    try:
+                        self.model = shared_model(self.api_key, self.model_name)
+                    except Exception as e:
+                        self.model = None
+                        self.model_error = e
+                self._model_loaded = True
+        return self.model
+
+    @staticmethod
+    def _create_cache():
+        # Persistent response cache; disabled with RESPONSE_CACHE=0
+        if not env_flag("RESPONSE_CACHE", True):
+            return None
+        try:
+            ttl = env_float("RESPONSE_CACHE_TTL", 0) or None
+            max_bytes = env_int("RESPONSE_CACHE_MAX_MB", 50) * 1024 * 1024
+            path = os.path.join(data_dir(), "responses.sqlite3")
+            return ResponseCache(path, max_bytes=max_bytes, ttl=ttl)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _create_context_cache():
+        # Server-side caching of long prompt prefixes; disabled with CONTEXT_CACHE=0
+        if not env_flag("CONTEXT_CACHE", True):
+            return None
+        return ContextCache(ttl=env_float("CONTEXT_CACHE_TTL", 600),
+                            min_tokens=env_int("CONTEXT_CACHE_MIN_TOKENS", 4096))
+
+    def _cache_key(self, prompt: str, model_name: Optional[str] = None) -> str:
+        return ResponseCache.make_key(model_name or self.model_name, prompt)
 
     def is_configured(self) -> bool:
-        return self.model is not None
+        return self.load_model() is not None
+
+    def get_model(self, model_name: Optional[str] = None):
+        """The model for model_name (default: MODEL_NAME), or None if the client isn't configured."""
+        if not model_name or model_name == self.model_name:
+            return self.load_model()
+        if not self.load_model():
+            return None
+        try:
+            return self.model_factory(model_name)
+        except Exception as e:
+            raise GeminiAPIError.from_exception(e)
+
+    def _latency_trackers(self, model_name: Optional[str]):
+        # Hedging thresholds are per model: a fast model's p95 says nothing about a slow one's
+        if not model_name or model_name == self.model_name:
+            return self.latency, self.first_chunk_latency
+        with self._trackers_lock:
+            if model_name not in self._trackers:
+                self._trackers[model_name] = (LatencyTracker(), LatencyTracker())
+            return self._trackers[model_name]
+
+    def lookup_cache(self, prompt: str, model: Optional[str] = None) -> Optional[str]:
+        if not self.cache:
+            return None
+        return self.cache.get(self._cache_key(prompt, model))
 
-    def generate_content(self, prompt: str) -> str:
-        """Generate content using the configured Gemini model.
+    def generate(self, prompt: str, model: Optional[str] = None, prefix: Optional[str] = None,
+                 cancelled: Optional[Callable[[], bool]] = None,
+                 before_attempt: Optional[Callable[[], None]] = None) -> str:
+        """Generate content using the configured Gemini model, or the named model when given.
 
-        Returns an error message string when model isn't configured or if the API call fails.
+        prefix is the stable leading part of prompt (see build_persona_prefix). When it is long
+        enough it is cached server-side and only the rest of the prompt is sent.
+
+        Rate-limit and transient errors are retried with jittered exponential backoff. cancelled()
+        is checked before every attempt and during backoff, and before_attempt() (e.g. a rate
+        limiter) is called before every attempt, retries included.
+        Raises GeminiAPIError when the model isn't configured, the request is cancelled or it
+        ultimately fails.
+        Successful responses are served from and stored in the response cache.
         """
-        if not self.model:
-            return (
-                "API key not configured. Please set the GENAI_API_KEY environment variable "
-                "and restart the app."
-            )
+        started = time.monotonic()
+        model_name = model or self.model_name
+        cached = self.lookup_cache(prompt, model_name)
+        if cached is not None:
+            self._record(prompt, started, cached, cached=True, model_name=model_name)
+            return cached
+        if not self.get_model(model_name):
+            raise GeminiAPIError(NOT_CONFIGURED_MESSAGE)
+
+        latency, _ = self._latency_trackers(model_name)
+        attempt = 0
+        while True:
+            self._check_cancelled(cancelled)
+            if before_attempt:
+                before_attempt()
+            try:
+                text = self._hedged(lambda: self._call(prompt, model_name, prefix), latency, before_attempt)
+                break
+            except Exception as e:
+                error = GeminiAPIError.from_exception(e)
+                attempt += 1
+                if not error.retryable or attempt >= self.max_attempts:
+                    self._record(prompt, started, None, attempts=attempt, error=error, model_name=model_name)
+                    raise error
+                self._backoff(attempt, error.retry_after, cancelled)
+        self._record(prompt, started, text, attempts=attempt + 1, model_name=model_name)
+        if self.cache:
+            self.cache.put(self._cache_key(prompt, model_name), text)
+        return text
+
+    def generate_content(self, prompt: str, model: Optional[str] = None, prefix: Optional[str] = None) -> str:
+        """Like generate, but returns the error message string instead of raising."""
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"An error occurred:\n{e}"
+            return self.generate(prompt, model, prefix)
+        except GeminiAPIError as e:
+            return str(e)
+
+    def fan_out(self, prompt: str, models: Sequence[str], prefix: Optional[str] = None,
+                cancelled: Optional[Callable[[], bool]] = None
+                ) -> Iterator[Tuple[str, Union[str, GeminiAPIError]]]:
+        """Send prompt to every model concurrently and yield (model, text or GeminiAPIError) in order
+        of arrival. Requests still running when the caller stops iterating finish in the background
+        (and land in the response cache)."""
+        results = queue.Queue()
+
+        def run(model_name):
+            try:
+                results.put((model_name, self.generate(prompt, model_name, prefix, cancelled)))
+            except GeminiAPIError as e:
+                results.put((model_name, e))
+
+        models = list(dict.fromkeys(models))
+        for model_name in models:
+            threading.Thread(target=run, args=(model_name,), daemon=True).start()
+        for _ in models:
+            yield results.get()
+
+    def generate_content_stream(self, prompt: str, model: Optional[str] = None, prefix: Optional[str] = None,
+                                cancelled: Optional[Callable[[], bool]] = None,
+                                before_attempt: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """Stream content from the configured Gemini model, yielding text chunks as they arrive.
+
+        Raises GeminiAPIError like generate, and checks cancelled() and calls before_attempt() the
+        same way. A failed attempt is retried only if it failed before yielding anything. A cache hit
+        is yielded as a single chunk; a completed stream is cached.
+        """
+        started = time.monotonic()
+        model_name = model or self.model_name
+        cached = self.lookup_cache(prompt, model_name)
+        if cached is not None:
+            self._record(prompt, started, cached, ttfb=time.monotonic() - started, cached=True, stream=True,
+                         model_name=model_name)
+            yield cached
+            return
+        if not self.get_model(model_name):
+            raise GeminiAPIError(NOT_CONFIGURED_MESSAGE)
+
+        attempt = 0
+        chunks = []
+        ttfb = None
+        while True:
+            self._check_cancelled(cancelled)
+            if before_attempt:
+                before_attempt()
+            try:
+                for text in self._hedged_stream(prompt, model_name, prefix, before_attempt):
+                    if ttfb is None:
+                        ttfb = time.monotonic() - started
+                    chunks.append(text)
+                    yield text
+                break
+            except Exception as e:
+                error = GeminiAPIError.from_exception(e)
+                attempt += 1
+                if chunks or not error.retryable or attempt >= self.max_attempts:
+                    self._record(prompt, started, "".join(chunks), ttfb=ttfb, attempts=attempt,
+                                 error=error, stream=True, model_name=model_name)
+                    raise error
+                self._backoff(attempt, error.retry_after, cancelled)
+        text = "".join(chunks)
+        self._record(prompt, started, text, ttfb=ttfb, attempts=attempt + 1, stream=True, model_name=model_name)
+        if self.cache and chunks:
+            self.cache.put(self._cache_key(prompt, model_name), text)
+
+    def _record(self, prompt: str, started: float, response: Optional[str], ttfb: Optional[float] = None,
+                attempts: int = 0, cached: bool = False, error: Optional[GeminiAPIError] = None,
+                stream: bool = False, model_name: Optional[str] = None):
+        response_chars = len(response) if response else 0
+        self.metrics.record(
+            "request",
+            model=model_name or self.model_name,
+            status="error" if error else "ok",
+            error_kind=error.kind if error else None,
+            cached=cached,
+            stream=stream,
+            attempts=attempts,
+            total=time.monotonic() - started,
+            ttfb=ttfb,
+            prompt_chars=len(prompt),
+            response_chars=response_chars,
+            prompt_tokens=estimate_tokens(len(prompt)),
+            response_tokens=estimate_tokens(response_chars),
+        )
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter, but never sooner than the server asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.backoff_max * 4))
+        return delay
+
+    def _backoff(self, attempt: int, retry_after: Optional[float], cancelled: Optional[Callable[[], bool]]):
+        # Sleep in short steps so a cancelled job stops retrying within a fraction of a second
+        deadline = time.monotonic() + self._backoff_delay(attempt, retry_after)
+        while True:
+            self._check_cancelled(cancelled)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.1))
 
     @staticmethod
-    def build_persona_prompt(action: str, code: str) -> str:
+    def _check_cancelled(cancelled: Optional[Callable[[], bool]]):
+        if cancelled and cancelled():
+            raise GeminiAPIError("Request cancelled.")
+
+    def _request_options(self) -> dict:
+        return {"timeout": self.call_timeout} if self.call_timeout else {}
+
+    def _target(self, prompt: str, model_name: Optional[str], prefix: Optional[str]):
+        """The model to call and the text to send: a context-cached model and the remainder of the
+        prompt when prefix is cached, otherwise the plain model and the full prompt."""
+        prefix = prefix_of(prompt, prefix)
+        if prefix and self.context_cache:
+            cached_model = self.context_cache.model_for(model_name or self.model_name, prefix)
+            if cached_model is not None:
+                return cached_model, prompt[len(prefix):]
+        return self.get_model(model_name), prompt
+
+    def _call(self, prompt: str, model_name: Optional[str] = None, prefix: Optional[str] = None) -> str:
+        started = time.monotonic()
+        model, contents = self._target(prompt, model_name, prefix)
+        response = model.generate_content(contents, request_options=self._request_options())
+        text = response.text
+        self._latency_trackers(model_name)[0].record(time.monotonic() - started)
+        return text
+
+    def _stream(self, prompt: str, model_name: Optional[str] = None, prefix: Optional[str] = None) -> Iterator[str]:
+        started = time.monotonic()
+        first = True
+        first_chunk_latency = self._latency_trackers(model_name)[1]
+        model, contents = self._target(prompt, model_name, prefix)
+        response = model.generate_content(contents, stream=True, request_options=self._request_options())
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety metadata) carry nothing to display
+                continue
+            if text:
+                if first:
+                    first_chunk_latency.record(time.monotonic() - started)
+                    first = False
+                yield text
+
+    def _hedge_delay(self, tracker: LatencyTracker) -> Optional[float]:
+        if not self.hedge or len(tracker) < self.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.HEDGE_MIN_DELAY, tracker.percentile(95))
+
+    def _hedged(self, call: Callable[[], str], tracker: LatencyTracker,
+                before_attempt: Optional[Callable[[], None]] = None) -> str:
+        """Run call; if it outlives the p95 latency, race a second copy and take the first success.
+        The second copy is an attempt of its own: it is only launched once before_attempt() returns,
+        and skipped if it raises (e.g. an exhausted budget)."""
+        delay = self._hedge_delay(tracker)
+        if delay is None:
+            return call()
+
+        results = queue.Queue()
+
+        def attempt(hedge):
+            if hedge and before_attempt:
+                try:
+                    before_attempt()
+                except Exception:
+                    results.put(None)
+                    return
+            try:
+                results.put((True, call()))
+            except Exception as e:
+                results.put((False, e))
+
+        threading.Thread(target=attempt, args=(False,), daemon=True).start()
+        hedged, launched, failures, error = False, 1, 0, None
+        while True:
+            try:
+                item = results.get(timeout=None if hedged else delay)
+            except queue.Empty:
+                threading.Thread(target=attempt, args=(True,), daemon=True).start()
+                hedged, launched = True, 2
+                continue
+            if item is None:
+                launched -= 1
+            else:
+                ok, value = item
+                if ok:
+                    return value
+                failures, error = failures + 1, value
+            if failures == launched:
+                raise error
+
+    def _hedged_stream(self, prompt: str, model_name: Optional[str] = None, prefix: Optional[str] = None,
+                       before_attempt: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """Stream prompt; if no chunk arrives within the p95 time-to-first-chunk, race a second stream
+        and follow whichever produces a chunk first. before_attempt() gates the second stream as in
+        _hedged."""
+        delay = self._hedge_delay(self._latency_trackers(model_name)[1])
+        if delay is None:
+            yield from self._stream(prompt, model_name, prefix)
+            return
+
+        events = queue.Queue()
+        stop = threading.Event()
+
+        def pump(attempt_id):
+            if attempt_id and before_attempt:
+                try:
+                    before_attempt()
+                except Exception:
+                    events.put((attempt_id, "skipped", None))
+                    return
+            try:
+                for text in self._stream(prompt, model_name, prefix):
+                    if stop.is_set():
+                        return
+                    events.put((attempt_id, "chunk", text))
+                events.put((attempt_id, "end", None))
+            except Exception as e:
+                events.put((attempt_id, "error", e))
+
+        threading.Thread(target=pump, args=(0,), daemon=True).start()
+        hedged, launched, failures, error, winner = False, 1, 0, None, None
+        try:
+            while True:
+                try:
+                    waiting = winner is None and not hedged
+                    attempt_id, kind, payload = events.get(timeout=delay if waiting else None)
+                except queue.Empty:
+                    threading.Thread(target=pump, args=(1,), daemon=True).start()
+                    hedged, launched = True, 2
+                    continue
+                if winner is None:
+                    if kind in ("error", "skipped"):
+                        if kind == "error":
+                            failures, error = failures + 1, payload
+                        else:
+                            launched -= 1
+                        if failures == launched:
+                            raise error
+                        continue
+                    winner = attempt_id
+                if attempt_id != winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "end":
+                    return
+                else:
+                    raise payload
+        finally:
+            stop.set()
+
+    # Persona prompts put everything that stays the same across actions on one input (persona,
+    # constraints, code) first and the action last, so the prefix can be cached and reused.
+    @staticmethod
+    def build_persona_prefix(code: str, context: str = "") -> str:
         return f"""
         Persona: You are an expert senior software architect specializing in writing clean, efficient, and 
         well-documented code following all standard best practices for the language provided.
 
-        Task: Your task is to {action} for the following code snippet.
-
         Constraint: Return ONLY the updated, raw code block. Do not include explanations, greetings, or any markdown 
         formatting for the code block.
+{GeminiAPIClient.build_context_section(context)}
+        Code Snippet:
+        {code}
+        """
+
+    @staticmethod
+    def build_persona_prompt(action: str, code: str, context: str = "") -> str:
+        return GeminiAPIClient.build_persona_prefix(code, context) + f"""
+        Task: Your task is to {action} for the code snippet above.
+        """
+
+    @staticmethod
+    def build_chunk_prompt(action: str, code: str) -> str:
+        return f"""
+        Persona: You are an expert senior software architect specializing in writing clean, efficient, and 
+        well-documented code following all standard best practices for the language provided.
+
+        Task: Your task is to {action} for the following code snippet. The snippet is one section of a larger 
+        file; other sections are handled separately.
+
+        Constraint: Return ONLY the updated, raw code for this section. Do not add code from other sections, 
+        explanations, greetings, or any markdown formatting for the code block.
 
         Code Snippet:
         {code}
         """
 
     @staticmethod
-    def build_refinement_prompt(refinement_instruction: str, previous_code: str) -> str:
+    def build_context_section(context: str) -> str:
+        # Definitions from the project index that the code refers to; empty when there are none
+        if not context:
+            return ""
+        return f"""
+        Project Context (existing definitions the code uses, for reference only; do not return them):
+{context}
+"""
+
+    @staticmethod
+    def build_refinement_prompt(refinement_instruction: str, previous_code: str, context: str = "") -> str:
         return f"""
         Iterative Refinement: You are an expert code assistant. Refine the following code according to this new 
         instruction: "{refinement_instruction}".
 
         Constraint: Return ONLY the updated, raw code block. Do not include explanations, greetings, or any markdown 
         formatting for the code block.
-
+{GeminiAPIClient.build_context_section(context)}
         Previous Output:
         {previous_code}
         """
+
+    @staticmethod
+    def build_delta_refinement_prompt(refinement_instruction: str, previous_code: str, context: str = "") -> str:
+        return f"""
+        Iterative Refinement: You are an expert code assistant. Refine the following code according to this new 
+        instruction: "{refinement_instruction}".
+
+        Constraint: Do NOT return the whole code. Return ONLY edit blocks in exactly this format, one per change:
+<<<<<<< SEARCH
+exact lines copied from the current code
+=======
+replacement lines
+>>>>>>> REPLACE
+        Each SEARCH section must match the current code exactly, including indentation, and contain enough lines 
+        to be unique. Keep blocks small. Do not include explanations, greetings, or any markdown formatting. 
+        If no change is needed, return only: NO CHANGES
+{GeminiAPIClient.build_context_section(context)}
+        Current Code:
+        {previous_code}
+        """
+
+    @staticmethod
+    def build_correction_prompt(problems: Sequence[str], code: str) -> str:
+        details = "\n".join(problems)
+        return f"""
+        Correction: You are an expert code assistant. The code below was checked and has these problems:
+{details}
+
+        Constraint: Fix ONLY these problems and keep everything else unchanged. Return ONLY the corrected, raw 
+        code block. Do not include explanations, greetings, or any markdown formatting for the code block.
+
+        Current Code:
+        {code}
+        """
@@ -1,22 +1,33 @@
 import os
 import threading
+import time
 from tkinter import filedialog
 
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except Exception:
-    pass
-
 import customtkinter as ctk
 from theme import Theme
-from api_client import GeminiAPIClient
+from api_client import GeminiAPIClient, GeminiAPIError
+from chunker import ChunkedProcessor, split_code
+from config import env_flag, env_float, env_int, env_list
+from diff_view import DiffCache, DiffWindow
+from large_file import LargeTextView, read_text_file
+from metrics import get_recorder
+from metrics_panel import MetricsWindow
+from patching import PatchError, apply_model_edits
+from project_index import ProjectIndexes
+from router import ModelRouter
+from scheduler import CANCELLED, DONE, JobScheduler
+from speculation import ClickStats, Speculator, text_digest
 from sidebar import Sidebar
+from validation import OutputValidator, expects_python
 from history import RefinementHistoryPanel
+from workspace import TabBar, TabState
 
 
 class CodeAssistantApp(ctk.CTk):
-    def __init__(self):
+    # Streamed chunks are coalesced and handed to the Tk thread at most this often (seconds)
+    STREAM_FLUSH_INTERVAL = 0.05
+
+    def __init__(self, api_client: GeminiAPIClient = None):
         super().__init__()
 
         # --- Window Setup ---
@@ -30,8 +41,52 @@ class CodeAssistantApp(ctk.CTk):
         self.grid_columnconfigure(2, weight=2)
         self.grid_rowconfigure(0, weight=1)
 
-        # API client
-        self.api_client = GeminiAPIClient()
+        # API client; the SDK and model load in the background once the window is up
+        self.api_client = api_client or GeminiAPIClient(load_model=False)
+        self._stream_started = False
+
+        # Inputs longer than this many lines are split and processed chunk by chunk
+        self.chunk_threshold_lines = env_int("CHUNK_THRESHOLD_LINES", 400)
+        self.chunk_processor = ChunkedProcessor(self.api_client, max_workers=env_int("CHUNK_WORKERS", 4))
+        # Refinements of outputs at least this long ask for edit blocks instead of a full rewrite
+        self.delta_min_lines = env_int("DELTA_REFINEMENT_MIN_LINES", 30)
+        self.input_file_path = None
+
+        # Outputs are checked on the worker thread before they are shown or recorded; failures get
+        # up to VALIDATION_RETRIES corrective requests
+        self.validator = OutputValidator.from_env() if env_flag("VALIDATION", True) else None
+        self.validation_retries = env_int("VALIDATION_RETRIES", 1)
+
+        # Index of the imported file's project; prompts include up to PROJECT_CONTEXT_TOKENS of the
+        # definitions the code uses
+        self.project_indexes = ProjectIndexes.from_env() if env_flag("PROJECT_INDEX", True) else None
+        self.project_context_tokens = env_int("PROJECT_CONTEXT_TOKENS", 1500)
+
+        # Per-request model choice (MODEL_ROUTES), and the models raced when fan-out is switched on
+        self.router = ModelRouter.from_env(self.api_client.model_name, get_recorder())
+        self.fan_out_models = env_list("FANOUT_MODELS")
+        self.fan_out_mode = os.environ.get("FANOUT_MODE", "first").strip().lower()
+        self.fan_out_window = None
+
+        # Jobs share a bounded worker pool; the output box follows the most recently submitted job
+        self.scheduler = JobScheduler(max_workers=env_int("MAX_CONCURRENT_JOBS", 2),
+                                      default_timeout=env_float("REQUEST_TIMEOUT", 120) or None,
+                                      on_change=lambda: self.after(0, self._refresh_job_queue),
+                                      metrics=get_recorder())
+        self._display_job = None
+        self.metrics_window = None
+        self.diff_window = None
+        self.diff_cache = DiffCache()
+
+        # Opt-in: precompute the likeliest next action/refinement while idle (SPECULATION=1)
+        self.speculator = None
+        self.click_stats = None
+        if env_flag("SPECULATION", False):
+            self.click_stats = ClickStats.open_default()
+            self.speculator = Speculator(busy=lambda: bool(self.scheduler.active_jobs()),
+                                         budget_per_hour=env_int("SPECULATION_BUDGET_PER_HOUR", 30),
+                                         idle_seconds=env_float("SPECULATION_IDLE_SECONDS", 3.0))
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
         # Sidebar (pass callbacks)
         callbacks = {
@@ -40,6 +95,10 @@ class CodeAssistantApp(ctk.CTk):
             "preset_selected": self._on_preset_selected,
             "refine_last_output": self.refine_last_output,
             "export_output": self.export_output,
+            "cancel_job": self.cancel_job,
+            "cancel_all_jobs": self.cancel_all_jobs,
+            "show_metrics": self.show_metrics,
+            "show_diff": self.show_diff,
         }
         self.sidebar = Sidebar(self, callbacks)
         self.sidebar.grid(row=0, column=0, rowspan=1, sticky="nsew")
@@ -50,17 +109,31 @@ class CodeAssistantApp(ctk.CTk):
         self.history_panel = RefinementHistoryPanel(self)
         self.history_panel.grid(row=0, column=2, sticky="nsew", padx=(0, 10), pady=10)
 
+        # Open documents; the editors and history panel always show the active one
+        self.tabs = []
+        self.active_tab = None
+        self._job_tabs = {}
+        # A job whose streamed chunks were missed while its tab was hidden; its output is set when it finishes
+        self._detached_job = None
+        self.new_tab()
+
+        self.after(50, self._start_model_load)
+
     def _create_main_content(self):
         self.main_frame = ctk.CTkFrame(self, corner_radius=0, fg_color=Theme.BACKGROUND)
         self.main_frame.grid(row=0, column=1, rowspan=1, sticky="nsew", padx=10, pady=10)
-        self.main_frame.grid_rowconfigure(0, weight=1)
+        self.main_frame.grid_rowconfigure(1, weight=1)
         self.main_frame.grid_columnconfigure(0, weight=1)
         self.main_frame.grid_columnconfigure(1, weight=1)
 
+        self.tab_bar = TabBar(self.main_frame, on_select=self.switch_tab, on_new=lambda: self.new_tab(),
+                              on_close=self.close_tab)
+        self.tab_bar.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 5))
+
         # Input Textbox
         self.input_textbox = ctk.CTkTextbox(self.main_frame, font=("Consolas", 12), border_width=2,
                                             fg_color=Theme.TEXT_INPUT_BG, text_color=Theme.TEXT)
-        self.input_textbox.grid(row=0, column=0, sticky="nsew", padx=(0, 5))
+        self.input_textbox.grid(row=1, column=0, sticky="nsew", padx=(0, 5))
 
         # Placeholder management
         self.input_placeholder = "# Paste or type your code here...\n# Or click 'Import File' to load a file"
@@ -75,44 +148,203 @@ class CodeAssistantApp(ctk.CTk):
         # Output Textbox
         self.output_textbox = ctk.CTkTextbox(self.main_frame, font=("Consolas", 12), border_width=2,
                                              fg_color=Theme.TEXT_INPUT_BG, text_color=Theme.TEXT)
-        self.output_textbox.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
-        self.output_textbox.insert("1.0", "# AI-generated code will appear here...")
+        self.output_textbox.grid(row=1, column=1, sticky="nsew", padx=(5, 0))
+        self.output_placeholder = "# AI-generated code will appear here..."
+        self.output_textbox.insert("1.0", self.output_placeholder)
+
+        # Large-text handling: chunked inserts with a progress bar, paged read-only view for huge texts
+        large_file_options = {
+            "chunk_chars": env_int("LARGE_FILE_CHUNK_CHARS", 64 * 1024),
+            "chunked_threshold": env_int("LARGE_FILE_CHUNKED_THRESHOLD", 256 * 1024),
+            "paged_threshold": env_int("LARGE_FILE_PAGED_THRESHOLD", 2 * 1024 * 1024),
+            "page_lines": env_int("LARGE_FILE_PAGE_LINES", 2000),
+        }
+        self.input_view = LargeTextView(self.input_textbox, self.main_frame, self._set_load_progress,
+                                        **large_file_options)
+        self.input_view.nav.grid(row=2, column=0, sticky="ew", padx=(0, 5), pady=(5, 0))
+        self.input_view.nav.grid_remove()
+        self.output_view = LargeTextView(self.output_textbox, self.main_frame, self._set_load_progress,
+                                         **large_file_options)
+        self.output_view.nav.grid(row=2, column=1, sticky="ew", padx=(5, 0), pady=(5, 0))
+        self.output_view.nav.grid_remove()
+
+        self.load_progress = ctk.CTkProgressBar(self.main_frame, progress_color=Theme.BLUE)
+        self.load_progress.grid(row=3, column=0, columnspan=2, sticky="ew", pady=(5, 0))
+        self.load_progress.grid_remove()
 
     def process_code(self, action: str):
-        input_code = self.input_textbox.get("1.0", "end-1c")
+        input_code = self.input_view.get_text()
         if not input_code.strip() or input_code.strip() == self.input_placeholder:
-            self.output_textbox.delete("1.0", "end")
-            self.output_textbox.insert("1.0", "Error: Input code is empty.")
+            self.output_view.set_text("Error: Input code is empty.")
             return
 
-        self.sidebar.set_buttons_state("disabled")
-        self.output_textbox.delete("1.0", "end")
-        self.output_textbox.insert("1.0", "Processing...")
-        self.update_idletasks()
-
-        prompt = self.api_client.build_persona_prompt(action, input_code)
-        thread = threading.Thread(target=self._api_worker, args=(prompt,), daemon=True)
-        thread.start()
+        model = self.router.choose(action, input_code)
+        filename = self.input_file_path
+        if self.speculator:
+            self.click_stats.record("action", action)
+            result = self.speculator.take(("action", action, model, text_digest(input_code)))
+            if result is not None:
+                self._submit_job(action, lambda job: result, "Processing...")
+                return
+
+        fan_out = self.sidebar.fan_out_enabled()
+
+        def work(job):
+            # Splitting parses the whole input, which takes seconds on multi-megabyte files: do it
+            # on the worker, not the Tk thread
+            if input_code.count("\n") + 1 > self.chunk_threshold_lines:
+                chunks = split_code(input_code, filename, max_lines=self.chunk_threshold_lines // 2)
+                if len(chunks) > 1:
+                    return self._chunked_worker(job, action, chunks, model, input_code, filename)
+            prompt, prefix = self._persona_prompts(action, input_code, filename)
+            if fan_out:
+                return self._validated(job, self._fan_out_worker(job, prompt, prefix), input_code, filename)
+            return self._validated(job, self._api_worker(job, prompt, model, prefix), input_code, filename, model)
+
+        self._submit_job(action, work, "Processing...")
 
     def refine_last_output(self, refinement_instruction: str = None):
         # If called as a callback from Sidebar without args, read entry
         if refinement_instruction is None:
             refinement_instruction = self.sidebar.get_refinement_instruction()
 
-        output_code = self.output_textbox.get("1.0", "end-1c")
-        if not output_code.strip() or output_code.strip().startswith("# AI-generated code will appear here"):
-            self.output_textbox.delete("1.0", "end")
-            self.output_textbox.insert("1.0", "Error: No existing output to refine.")
+        use_delta = self.sidebar.delta_refinement_enabled()
+        filename = self.input_file_path
+        if self.speculator:
+            self.click_stats.record("refine", refinement_instruction)
+        base_job = self._display_job
+        after = None
+        if base_job is not None and not base_job.finished:
+            # The output box still shows a pending job: queue the refinement behind its result, held
+            # back by the scheduler so it takes no worker while it waits
+            after = base_job
+
+            def work(job):
+                return self._refine_after(job, base_job, refinement_instruction, use_delta, filename)
+        else:
+            output_code = self.output_view.get_text()
+            if not output_code.strip() or output_code.strip().startswith("# AI-generated code will appear here"):
+                self.output_view.set_text("Error: No existing output to refine.")
+                return
+            if self.speculator:
+                result = self.speculator.take(("refine", refinement_instruction, use_delta, text_digest(output_code)))
+                if result is not None:
+                    self._submit_job(f"Refine: {refinement_instruction}", lambda job: result,
+                                     "Processing refinement...")
+                    return
+
+            def work(job):
+                return self._refine_worker(job, refinement_instruction, output_code, use_delta, filename)
+
+        self._submit_job(f"Refine: {refinement_instruction}", work, "Processing refinement...", after=after)
+
+    def _submit_job(self, label: str, work, message: str, after=None):
+        if self.speculator:
+            self.speculator.note_activity()
+        if len(self.tabs) > 1:
+            label = f"{self.active_tab.title}: {label}"
+        self.output_view.set_text(message)
+        self._stream_started = False
+        self._display_job = self.scheduler.submit(
+            label, work, on_done=lambda job: self.after(0, self._on_job_done, job), after=after
+        )
+        self._job_tabs[self._display_job] = self.active_tab
+        self.active_tab.jobs.add(self._display_job)
+
+    def new_tab(self, title: str = None) -> TabState:
+        used = {tab.title for tab in self.tabs}
+        number = len(self.tabs) + 1
+        while f"Untitled {number}" in used:
+            number += 1
+        tab = TabState(title or f"Untitled {number}", self.output_placeholder)
+        self.tabs.append(tab)
+        self.switch_tab(tab.id)
+        return tab
+
+    def switch_tab(self, tab_id: int):
+        tab = next((t for t in self.tabs if t.id == tab_id), None)
+        if tab is None or tab is self.active_tab:
+            self.tab_bar.update_tabs(self.tabs, self.active_tab)
             return
+        if self.active_tab is not None:
+            self._stash_active_tab()
+        self._restore_tab(tab)
+
+    def close_tab(self):
+        tab = self.active_tab
+        for job in list(tab.jobs):
+            self.scheduler.cancel(job)
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        self.active_tab = None
+        if self.tabs:
+            self._restore_tab(self.tabs[min(index, len(self.tabs) - 1)])
+        else:
+            self.new_tab()
+
+    def _stash_active_tab(self):
+        tab = self.active_tab
+        tab.input_has_placeholder = self.input_has_placeholder
+        tab.input_text = "" if self.input_has_placeholder else self.input_view.get_text()
+        tab.output_text = self.output_view.get_text()
+        tab.input_file_path = self.input_file_path
+        tab.session_id = self.history_panel.session_id
+        tab.display_job = self._display_job
+        tab.stream_started = self._stream_started
+
+    def _restore_tab(self, tab: TabState):
+        self.active_tab = tab
+        tab.unseen = False
+        self.input_has_placeholder = tab.input_has_placeholder
+        self.input_file_path = tab.input_file_path
+        if tab.input_has_placeholder:
+            self.input_view.set_text(self.input_placeholder)
+            self.input_textbox.configure(text_color="#6c7a89")
+        else:
+            self.input_textbox.configure(text_color=Theme.TEXT)
+            self.input_view.set_text(tab.input_text)
+        self._display_job = tab.display_job
+        self._stream_started = tab.stream_started
+        if tab.display_job is not None and not tab.display_job.finished:
+            self._detached_job = tab.display_job
+            self._stream_started = False
+            self.output_view.set_text("Processing...")
+        else:
+            self.output_view.set_text(tab.output_text)
+        self.history_panel.load_session(tab.session_id)
+        # The widgets hold the texts now
+        tab.input_text = ""
+        tab.output_text = ""
+        self.tab_bar.update_tabs(self.tabs, tab)
+
+    def show_metrics(self):
+        if self.metrics_window is not None and self.metrics_window.winfo_exists():
+            self.metrics_window.focus()
+            return
+        self.metrics_window = MetricsWindow(self, get_recorder())
+
+    def show_diff(self):
+        if self.diff_window is not None and self.diff_window.winfo_exists():
+            self.diff_window.refresh()
+            self.diff_window.focus()
+            return
+        self.diff_window = DiffWindow(self, self._diff_sources, self.diff_cache)
+
+    def _diff_sources(self) -> dict:
+        # Editor texts are read here on the Tk thread; history steps load on the diff worker
+        sources = {
+            "Input": "" if self.input_has_placeholder else self.input_view.get_text(),
+            "Output": self.output_view.get_text(),
+        }
+        for i in range(len(self.history_panel.refinement_history)):
+            sources[f"Step {i + 1}"] = lambda i=i: self.history_panel.get_step_text(i)
+        return sources
 
-        self.sidebar.set_buttons_state("disabled")
-        self.output_textbox.delete("1.0", "end")
-        self.output_textbox.insert("1.0", "Processing refinement...")
-        self.update_idletasks()
+    def cancel_job(self, job):
+        self.scheduler.cancel(job)
 
-        prompt = self.api_client.build_refinement_prompt(refinement_instruction, output_code)
-        thread = threading.Thread(target=self._api_worker, args=(prompt,), daemon=True)
-        thread.start()
+    def cancel_all_jobs(self):
+        self.scheduler.cancel_all()
 
     def refine_last_output_from_entry(self):
         instruction = self.sidebar.get_refinement_instruction()
@@ -121,18 +353,50 @@ class CodeAssistantApp(ctk.CTk):
     def import_file(self):
         file_path = filedialog.askopenfilename(filetypes=[("All Files", "*.*")])
         if file_path:
-            with open(file_path, "r", encoding="utf-8") as file:
-                file_content = file.read()
-                self.input_textbox.delete("1.0", "end")
-                self.input_textbox.insert("1.0", file_content)
-                self.input_has_placeholder = False
-                self.input_textbox.configure(text_color=Theme.TEXT)
+            # Read and decode off the Tk thread; the text is then inserted in idle-time chunks
+            self._set_load_progress(0.0)
+            threading.Thread(target=self._read_file_worker, args=(file_path,), daemon=True).start()
+
+    def _read_file_worker(self, file_path: str):
+        try:
+            file_content = read_text_file(file_path, env_int("LARGE_FILE_MMAP_THRESHOLD", 16 * 1024 * 1024))
+        except (OSError, UnicodeDecodeError) as e:
+            self.after(0, self._on_file_load_failed, file_path, e)
+            return
+        self.after(0, self._on_file_loaded, file_path, file_content)
+
+    def _on_file_loaded(self, file_path: str, file_content: str):
+        self._set_load_progress(None)
+        # Keep the current document and open the file in a tab of its own, unless this tab is still blank
+        has_input = not self.input_has_placeholder and self.input_view.get_text().strip()
+        if has_input or self.history_panel.refinement_history:
+            self.new_tab(os.path.basename(file_path))
+        else:
+            self.active_tab.title = os.path.basename(file_path)
+            self.tab_bar.update_tabs(self.tabs, self.active_tab)
+        self.input_has_placeholder = False
+        self.input_textbox.configure(text_color=Theme.TEXT)
+        self.input_view.set_text(file_content)
+        self.input_file_path = file_path
+        if self.project_indexes is not None:
+            self.project_indexes.open(file_path)
+        self._speculate_actions()
+
+    def _on_file_load_failed(self, file_path: str, error: Exception):
+        self._set_load_progress(None)
+        self.output_view.set_text(f"Error opening {os.path.basename(file_path)}: {error}")
+
+    def _set_load_progress(self, fraction):
+        if fraction is None:
+            self.load_progress.grid_remove()
+            return
+        self.load_progress.grid()
+        self.load_progress.set(fraction)
 
     def export_output(self):
-        output_code = self.output_textbox.get("1.0", "end-1c")
+        output_code = self.output_view.get_text()
         if not output_code.strip() or output_code.strip().startswith("# AI-generated code will appear here"):
-            self.output_textbox.delete("1.0", "end")
-            self.output_textbox.insert("1.0", "Error: No output to export.")
+            self.output_view.set_text("Error: No output to export.")
             return
 
         file_path = filedialog.asksaveasfilename(filetypes=[("All Files", "*.*")])
@@ -140,36 +404,264 @@ class CodeAssistantApp(ctk.CTk):
             try:
                 with open(file_path, "w", encoding="utf-8") as file:
                     file.write(output_code)
-                self.output_textbox.delete("1.0", "end")
-                self.output_textbox.insert("1.0", f"Output saved to {os.path.basename(file_path)}")
+                self.output_view.set_text(f"Output saved to {os.path.basename(file_path)}")
                 # Clear the message after 3 seconds using a named method
                 self.after(3000, self._clear_output_message)
             except Exception as e:
-                self.output_textbox.delete("1.0", "end")
-                self.output_textbox.insert("1.0", f"Error saving file: {e}")
+                self.output_view.set_text(f"Error saving file: {e}")
 
     def clear_history(self):
         # Delegate to history panel
         self.history_panel.clear_history()
 
-    def _api_worker(self, prompt: str):
-        if not self.api_client.is_configured():
-            result_text = (
-                "API key not configured. Please set the GENAI_API_KEY environment variable "
-                "and restart the app."
+    def _api_worker(self, job, prompt: str, model: str = None, prefix: str = None):
+        # The client reports a missing API key itself after checking the response cache, so cached
+        # results stay available offline. Streamed chunks are coalesced so the event loop sees a
+        # handful of inserts, not one per token; the first chunk is flushed immediately.
+        chunks = []
+        pending = []
+        last_flush = 0.0
+        # Speculative runs pay for each request from their budget (see Speculator)
+        charge = getattr(job, "charge", None)
+        for chunk in self.api_client.generate_content_stream(prompt, model, prefix, lambda: job.cancelled, charge):
+            if job.cancelled:
+                return None
+            chunks.append(chunk)
+            pending.append(chunk)
+            now = time.monotonic()
+            if now - last_flush >= self.STREAM_FLUSH_INTERVAL:
+                self.after(0, self._on_stream_chunk, job, "".join(pending))
+                pending.clear()
+                last_flush = now
+        if pending:
+            self.after(0, self._on_stream_chunk, job, "".join(pending))
+        return "".join(chunks)
+
+    def _chunked_worker(self, job, action: str, chunks: list, model: str = None, source: str = "",
+                        filename: str = None):
+        def on_progress(done, total):
+            self.after(0, self._on_chunk_progress, job, done, total)
+
+        result = self.chunk_processor.run(action, chunks, on_progress, cancelled=lambda: job.cancelled, model=model)
+        # A corrective request would resend the whole file, which chunking exists to avoid
+        return self._validated(job, result, source, filename, model, retries=0)
+
+    def _fan_out_worker(self, job, prompt: str, prefix: str = None):
+        # "first": the first successful answer wins. "all": wait for every model, keep the first
+        # answer as the output and show all of them side by side.
+        results = {}
+        error = None
+        responses = self.api_client.fan_out(prompt, self.fan_out_models, prefix, lambda: job.cancelled)
+        for model, result in responses:
+            if job.cancelled:
+                return None
+            if isinstance(result, GeminiAPIError):
+                error = result
+                continue
+            results[model] = result
+            if self.fan_out_mode != "all":
+                return result
+        if not results:
+            raise error
+        if len(results) > 1:
+            self.after(0, self._show_fan_out, job, results)
+        return next(iter(results.values()))
+
+    def _refine_after(self, job, base_job, instruction: str, use_delta: bool, filename: str = None):
+        # Only runs once base_job has finished (see _submit_job's after)
+        if base_job.state != DONE or not base_job.result:
+            raise RuntimeError(f"'{base_job.label}' did not complete, nothing to refine.")
+        return self._refine_worker(job, instruction, base_job.result, use_delta, filename)
+
+    def _refine_worker(self, job, instruction: str, previous_code: str, use_delta: bool, filename: str = None):
+        # Ask for targeted edits and apply them locally, so tokens scale with the size of the change.
+        # If the edits don't apply cleanly, fall back to a streamed full rewrite.
+        model = self.router.choose(instruction, previous_code)
+        context = self._project_context(previous_code, filename)
+        if use_delta and previous_code.count("\n") + 1 >= self.delta_min_lines:
+            response = self.api_client.generate(
+                self.api_client.build_delta_refinement_prompt(instruction, previous_code, context), model,
+                cancelled=lambda: job.cancelled, before_attempt=getattr(job, "charge", None)
             )
-            self.after(0, self._on_result, result_text)
+            if job.cancelled:
+                return None
+            try:
+                return self._validated(job, apply_model_edits(previous_code, response), previous_code,
+                                       filename, model)
+            except PatchError:
+                pass
+        prompt = self.api_client.build_refinement_prompt(instruction, previous_code, context)
+        return self._validated(job, self._api_worker(job, prompt, model), previous_code, filename, model)
+
+    def _persona_prompts(self, action: str, code: str, filename: str = None):
+        # (prompt, prefix); follow-up actions on the same input share the prefix, which the client can cache
+        context = self._project_context(code, filename)
+        return (self.api_client.build_persona_prompt(action, code, context),
+                self.api_client.build_persona_prefix(code, context))
+
+    def _project_context(self, code: str, filename: str = None) -> str:
+        # Runs on the worker thread; answers from the index as it is, never waiting for a refresh
+        if self.project_indexes is None:
+            return ""
+        return self.project_indexes.context_for(code, filename, self.project_context_tokens)
+
+    def _validated(self, job, text: str, source: str, filename: str = None, model: str = None,
+                   retries: int = None) -> str:
+        # Runs on the worker thread. Python is only held to syntax checks when the code the output
+        # was derived from parses itself. Output that still fails after the retries is kept and flagged.
+        if self.validator is None or text is None or job.cancelled:
+            return text
+        python = expects_python(source, filename)
+        suffix = os.path.splitext(filename)[1] if filename else (".py" if python else ".txt")
+        text, problems = self.validator.check(text, python, suffix, source)
+        for _ in range(self.validation_retries if retries is None else retries):
+            if not problems:
+                break
+            response = self.api_client.generate(self.api_client.build_correction_prompt(problems, text), model,
+                                                cancelled=lambda: job.cancelled,
+                                                before_attempt=getattr(job, "charge", None))
+            if job.cancelled:
+                return None
+            text, problems = self.validator.check(response, python, suffix, source)
+        # Speculative runs have no label; their results are checked again only by being taken
+        label = getattr(job, "label", None)
+        if problems and label:
+            summary = problems[0].strip().splitlines()[0] if problems[0].strip() else "check failed"
+            self.after(0, self.sidebar.set_status, f"{label}: output has problems: {summary}", Theme.YELLOW)
+        return text
+
+    def _on_chunk_progress(self, job, done: int, total: int):
+        if job is not self._display_job or job.cancelled:
+            return
+        self.output_view.set_text(f"Processing... {done}/{total} chunks done")
+
+    def _on_stream_chunk(self, job, text: str):
+        # Only the most recently submitted job writes to the output box
+        if job is not self._display_job or job.cancelled or job is self._detached_job:
             return
+        if not self._stream_started:
+            # Replace the "Processing..." message with the first batch
+            self.output_view.set_text("")
+            self._stream_started = True
+        self.output_view.append(text)
+
+    def _on_job_done(self, job):
+        tab = self._job_tabs.pop(job, None)
+        if tab is not None:
+            tab.jobs.discard(job)
+            if tab is not self.active_tab:
+                if tab in self.tabs:
+                    self._on_background_job_done(tab, job)
+                return
+        if job is self._detached_job:
+            self._detached_job = None
+        displayed = job is self._display_job
+        if job.state == DONE:
+            # Streamed output is already in the textbox; only rewrite it when nothing was streamed
+            # Results too large to keep in a plain textbox switch to the paged view either way
+            # as do results that validation changed (fences stripped, formatted or corrected)
+            if displayed and (not self._stream_started or len(job.result) > self.output_view.paged_threshold
+                              or self.output_view.get_text() != job.result):
+                self.output_view.set_text(job.result)
+            # Add to history panel
+            self.history_panel.add_refinement(job.result)
+            if displayed:
+                self._speculate_refinements(job.result)
+        elif displayed:
+            message = "Cancelled." if job.state == CANCELLED else f"Error: {job.error}"
+            self.output_view.set_text(message)
+
+    def _on_background_job_done(self, tab: TabState, job):
+        # The tab has no widgets while inactive: record the result in its state and history session
+        if job.state == DONE:
+            if tab.session_id is None:
+                tab.session_id = self.history_panel.store.create_session()
+            self.history_panel.add_to_session(tab.session_id, job.result)
+            if job is tab.display_job:
+                tab.output_text = job.result
+        elif job is tab.display_job:
+            tab.output_text = "Cancelled." if job.state == CANCELLED else f"Error: {job.error}"
+        tab.unseen = True
+        self.tab_bar.update_tabs(self.tabs, self.active_tab)
+
+    def _show_fan_out(self, job, results: dict):
+        if job is not self._display_job or job.cancelled:
+            return
+        if self.fan_out_window is not None and self.fan_out_window.winfo_exists():
+            self.fan_out_window.destroy()
+        models = list(results)
+        self.fan_out_window = DiffWindow(self, lambda: dict(results), self.diff_cache,
+                                         left=models[0], right=models[1])
+        self.fan_out_window.title(f"Fan-out: {job.label}")
+
+    def _speculate_actions(self):
+        if not self.speculator:
+            return
+        self.speculator.invalidate("action")
+        input_code = self.input_view.get_text()
+        # Chunked inputs cost several requests per action, too much to spend on a guess
+        if not input_code.strip() or input_code.count("\n") + 1 > self.chunk_threshold_lines:
+            return
+        filename = self.input_file_path
+        candidates = []
+        for action in self.click_stats.likely("action", env_int("SPECULATION_TOP_K", 1),
+                                              env_float("SPECULATION_MIN_SHARE", 0.3)):
+            model = self.router.choose(action, input_code)
+            candidates.append((("action", action, model, text_digest(input_code)),
+                               lambda run, action=action, model=model:
+                               self._speculative_worker(run, action, input_code, model, filename)))
+        self.speculator.speculate(candidates)
+
+    def _speculate_refinements(self, previous_code: str):
+        if not self.speculator:
+            return
+        self.speculator.invalidate("refine")
+        use_delta = self.sidebar.delta_refinement_enabled()
+        filename = self.input_file_path
+        candidates = []
+        for instruction in self.click_stats.likely("refine", env_int("SPECULATION_TOP_K", 1),
+                                                   env_float("SPECULATION_MIN_SHARE", 0.3)):
+            candidates.append((("refine", instruction, use_delta, text_digest(previous_code)),
+                               lambda run, instruction=instruction:
+                               self._refine_worker(run, instruction, previous_code, use_delta, filename)))
+        self.speculator.speculate(candidates)
+
+    def _speculative_worker(self, run, action: str, code: str, model: str, filename: str = None):
+        # Like _api_worker, but nothing is shown while it streams
+        prompt, prefix = self._persona_prompts(action, code, filename)
+        chunks = []
+        for chunk in self.api_client.generate_content_stream(prompt, model, prefix, lambda: run.cancelled, run.charge):
+            if run.cancelled:
+                return None
+            chunks.append(chunk)
+        return self._validated(run, "".join(chunks), code, filename, model)
+
+    def _start_model_load(self):
+        if self.api_client.model_loaded:
+            self._on_model_loaded()
+            return
+        threading.Thread(target=self._model_load_worker, name="model-load", daemon=True).start()
+
+    def _model_load_worker(self):
+        # Requests submitted meanwhile wait for this inside the client, on their worker threads
+        self.api_client.load_model()
+        self.after(0, self._on_model_loaded)
+
+    def _on_model_loaded(self):
+        client = self.api_client
+        if client.model is not None:
+            self.sidebar.set_status(f"Model ready: {client.model_name}", Theme.GREEN)
+        elif not client.api_key:
+            self.sidebar.set_status("API key not configured", Theme.YELLOW)
+        else:
+            self.sidebar.set_status(f"Model unavailable: {client.model_error}", Theme.YELLOW)
 
-        result_text = self.api_client.generate_content(prompt)
-        self.after(0, self._on_result, result_text)
+    def _refresh_job_queue(self):
+        self.sidebar.job_queue.update_jobs(self.scheduler.active_jobs())
 
-    def _on_result(self, text: str):
-        self.output_textbox.delete("1.0", "end")
-        self.output_textbox.insert("1.0", text)
-        self.sidebar.set_buttons_state("normal")
-        # Add to history panel
-        self.history_panel.add_refinement(text)
+    def _on_close(self):
+        self.scheduler.shutdown()
+        self.destroy()
 
     def _on_preset_selected(self, preset: str):
         if preset and preset != "Select preset...":
@@ -193,6 +685,8 @@ class CodeAssistantApp(ctk.CTk):
             self.input_has_placeholder = True
 
     def _on_input_key_press(self, event):
+        if self.speculator:
+            self.speculator.invalidate("action")
         if self.input_has_placeholder:
             self.input_textbox.delete("1.0", "end")
             self.input_textbox.configure(text_color=Theme.TEXT)
@@ -201,6 +695,6 @@ class CodeAssistantApp(ctk.CTk):
     def _clear_output_message(self):
         """Clear transient messages in the output textbox."""
         try:
-            self.output_textbox.delete("1.0", "end")
+            self.output_view.set_text("")
         except Exception:
             pass
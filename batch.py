@@ -0,0 +1,258 @@
+"""
+Headless batch mode - applies one action to every matching file under a directory.
+
+Usage:
+    python main.py batch SRC_DIR --action comments --pattern "*.py" --output OUT_DIR
+    python batch.py SRC_DIR --action "add type hints" --in-place --concurrency 8 --rate 120
+
+Does not import customtkinter, so it runs in CI and on machines without a display.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from api_client import GeminiAPIClient, GeminiAPIError
+from chunker import join_chunks, split_code
+from config import env_flag
+from patching import strip_fences
+from router import ModelRouter
+from validation import OutputValidator, ValidationError, expects_python
+
+# Short names for the sidebar actions; any other value is used as the action text itself
+ACTIONS = {
+    "comments": "add detailed comments",
+    "refactor": "refactor this code for readability and efficiency",
+    "docs": "generate professional-level documentation",
+}
+
+SKIPPED_DIRS = {".git", ".hg", ".svn", ".idea", ".venv", "venv", "node_modules", "__pycache__"}
+MANIFEST_NAME = ".codeassistant-manifest.json"
+
+# Read once at import: os.umask can only be read by setting it, which isn't safe with threads running
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class RateLimiter:  # Token bucket shared by all worker threads
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Manifest:  # Records finished files so an interrupted run can resume
+    def __init__(self, path: str, action: str):
+        self.path = path
+        self.action = action
+        self.files = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                if data.get("action") == action:
+                    self.files = data.get("files", {})
+            except (OSError, ValueError):
+                self.files = {}
+
+    def is_done(self, rel_path: str, digest: str) -> bool:
+        entry = self.files.get(rel_path)
+        return bool(entry) and entry.get("status") == "done" and entry.get("sha256") == digest
+
+    def record(self, rel_path: str, digest: str, status: str, error: str = None):
+        with self._lock:
+            entry = {"sha256": digest, "status": status}
+            if error:
+                entry["error"] = error
+            self.files[rel_path] = entry
+            payload = json.dumps({"action": self.action, "files": self.files}, indent=1, sort_keys=True)
+            atomic_write(self.path, payload)
+
+
+def atomic_write(path: str, content: str, mode: int = None):
+    """Replace path with content. The file gets mode, else the mode of the file it replaces, else
+    the permissions a plain open() would create it with (mkstemp's are owner-only)."""
+    if mode is None:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except OSError:
+            mode = 0o666 & ~_UMASK
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def find_files(root: str, patterns, exclude_dir: str = None):
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if d not in SKIPPED_DIRS and os.path.abspath(os.path.join(dirpath, d)) != exclude_dir
+        )
+        for name in sorted(filenames):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                yield os.path.join(dirpath, name)
+
+
+class BatchRunner:
+    def __init__(self, client: GeminiAPIClient, action: str, concurrency: int = 4,
+                 rate_per_minute: float = 0, chunk_lines: int = 400, router: ModelRouter = None,
+                 validator: OutputValidator = None):
+        self.client = client
+        self.router = router
+        self.validator = validator
+        self.action = action
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate_per_minute)
+        self.chunk_lines = chunk_lines
+
+    def _generate(self, prompt: str, model: str = None) -> str:
+        # Cache hits don't spend rate-limit budget; every attempt, retries included, does
+        cached = self.client.lookup_cache(prompt, model)
+        if cached is not None:
+            return cached
+        return self.client.generate(prompt, model, before_attempt=self.limiter.acquire)
+
+    def process_text(self, code: str, filename: str) -> str:
+        model = self.router.choose(self.action, code) if self.router else None
+        chunks = [code]
+        if code.count("\n") + 1 > self.chunk_lines:
+            chunks = split_code(code, filename, max_lines=self.chunk_lines // 2)
+        if len(chunks) <= 1:
+            result = self._generate(self.client.build_persona_prompt(self.action, code), model)
+        else:
+            result = join_chunks([
+                strip_fences(self._generate(self.client.build_chunk_prompt(self.action, chunk), model), chunk)
+                for chunk in chunks
+            ], chunks)
+        if self.validator is None:
+            return result
+        suffix = os.path.splitext(filename)[1] or ".txt"
+        result, problems = self.validator.check(result, expects_python(code, filename), suffix, code)
+        if problems:
+            # Nothing is written, so an in-place run never replaces a file with broken output
+            raise ValidationError(f"Output failed validation: {problems[0]}")
+        return result
+
+    def run(self, src_dir: str, patterns, output_dir: str = None, manifest_path: str = None) -> int:
+        """Process every matching file; returns the number of failed files."""
+        manifest = Manifest(manifest_path or os.path.join(output_dir or src_dir, MANIFEST_NAME), self.action)
+        files = list(find_files(src_dir, patterns, exclude_dir=output_dir))
+        total = len(files)
+        failed = 0
+        done = 0
+
+        def work(path):
+            rel_path = os.path.relpath(path, src_dir)
+            try:
+                with open(path, "rb") as file:
+                    raw = file.read()
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except OSError as e:
+                manifest.record(rel_path, "", "failed", str(e))
+                return rel_path, "failed", str(e)
+            digest = hashlib.sha256(raw).hexdigest()
+            target = os.path.join(output_dir, rel_path) if output_dir else path
+            if manifest.is_done(rel_path, digest) and os.path.exists(target):
+                return rel_path, "skipped", None
+            try:
+                result = self.process_text(raw.decode("utf-8"), path)
+            except (GeminiAPIError, UnicodeDecodeError, ValidationError) as e:
+                manifest.record(rel_path, digest, "failed", str(e))
+                return rel_path, "failed", str(e)
+            try:
+                # Outputs keep the source file's permissions (and executable bit)
+                atomic_write(target, result, mode)
+            except OSError as e:
+                manifest.record(rel_path, digest, "failed", str(e))
+                return rel_path, "failed", str(e)
+            # In-place runs record the hash of the rewritten file so it isn't processed again
+            if not output_dir:
+                digest = hashlib.sha256(result.encode("utf-8")).hexdigest()
+            manifest.record(rel_path, digest, "done")
+            return rel_path, "done", None
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [pool.submit(work, path) for path in files]
+            for future in as_completed(futures):
+                rel_path, status, error = future.result()
+                done += 1
+                if status == "failed":
+                    failed += 1
+                    print(f"[{done}/{total}] {rel_path}: failed: {error}", file=sys.stderr)
+                else:
+                    print(f"[{done}/{total}] {rel_path}: {status}", file=sys.stderr)
+        return failed
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="codeassistant batch", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("src_dir", help="Directory to process")
+    parser.add_argument("--action", default="comments",
+                        help=f"One of {', '.join(ACTIONS)} or free-form action text (default: comments)")
+    parser.add_argument("--pattern", action="append", dest="patterns",
+                        help='Filename glob to include; repeatable (default: "*.py")')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="Write results to this directory, mirroring the source tree")
+    target.add_argument("--in-place", action="store_true", help="Overwrite the source files")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests (default: 4)")
+    parser.add_argument("--rate", type=float, default=0, help="Max API requests per minute (default: unlimited)")
+    parser.add_argument("--chunk-lines", type=int, default=400, help="Split files longer than this (default: 400)")
+    parser.add_argument("--manifest", help=f"Resume manifest path (default: <output>/{MANIFEST_NAME})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    client = GeminiAPIClient()
+    if not client.is_configured():
+        print("Warning: API key not configured; only cached results are available.", file=sys.stderr)
+    runner = BatchRunner(client, ACTIONS.get(args.action, args.action), concurrency=args.concurrency,
+                         rate_per_minute=args.rate, chunk_lines=args.chunk_lines,
+                         router=ModelRouter.from_env(client.model_name, client.metrics),
+                         validator=OutputValidator.from_env() if env_flag("VALIDATION", True) else None)
+    failed = runner.run(args.src_dir, args.patterns or ["*.py"], output_dir=args.output,
+                        manifest_path=args.manifest)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+    sys.exit(main())
@@ -0,0 +1,444 @@
+"""
+Offline benchmark suite for CodeAssistant, driven by the mock backend in mock_backend.py.
+
+Usage:
+    python benchmark.py                           # run and print a JSON report
+    python benchmark.py --save-baseline base.json # record a baseline
+    python benchmark.py --baseline base.json      # compare against it (exit code 1 on regression)
+    python benchmark.py --scenario startup        # import-time report and time to first window
+
+Scenarios:
+    jobs     concurrent jobs through JobScheduler: throughput and end-to-end latency (no GUI)
+    context  several actions on one input with and without prefix context caching: characters
+             sent per request and latency (no GUI)
+    startup  import time of the app module (with the slowest imports listed on stderr), and, in a
+             fresh process, time from launch to the first painted window and to the model being
+             ready; exit code 1 when the first window takes longer than --startup-budget (GUI)
+    diff     side-by-side diff of a --diff-lines file against a commented copy and against a
+             rewritten copy (no GUI)
+    chunks   split a large file, grow one function in the middle and split it again: how many
+             chunks must be resubmitted; exit code 1 when a chunk without the edit changed (no GUI)
+    history  cost of RefinementHistoryPanel.add_refinement as the history grows, and how long it
+             blocks the Tk thread (GUI)
+    app      process_code + N refine_last_output through the real app: latency, event-loop
+             stall time and memory growth per refinement (GUI)
+
+GUI scenarios need a display; on Linux without one, Xvfb is started when it is installed,
+otherwise they are skipped.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep benchmark runs away from the user's cache, history and traces
+os.environ.setdefault("CODEASSISTANT_DATA_DIR", tempfile.mkdtemp(prefix="codeassistant-bench-"))
+os.environ.setdefault("RESPONSE_CACHE", "0")
+os.environ.setdefault("METRICS_TRACE", "0")
+
+from metrics import percentile  # noqa: E402
+from mock_backend import make_mock_client  # noqa: E402
+from scheduler import DONE, JobScheduler  # noqa: E402
+
+# Report keys where a higher value is better; everything else is a cost
+HIGHER_IS_BETTER = {"jobs_per_second"}
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a fresh interpreter by the startup scenario: the same path as main.py, timed until the
+# window is painted and until the background model load has finished
+STARTUP_PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+import main
+from app import CodeAssistantApp
+app = CodeAssistantApp()
+app.update()
+print("window", time.time(), flush=True)
+deadline = time.time() + 60
+while not app.api_client.model_loaded and time.time() < deadline:
+    app.update()
+    time.sleep(0.005)
+print("ready", time.time(), flush=True)
+app.scheduler.shutdown()
+app.destroy()
+"""
+
+SAMPLE_CODE = "".join(
+    f"def function_{i}(values):\n"
+    f"    total = 0\n"
+    f"    for value in values:\n"
+    f"        total += value * {i}\n"
+    f"    return total\n\n\n"
+    for i in range(60)
+)
+
+
+def mock_options(args) -> dict:
+    return {
+        "latency": args.latency,
+        "chars_per_second": args.rate,
+        "error_rate": args.error_rate,
+        "output_chars": args.output_chars,
+        "seed": 1234,
+    }
+
+
+def bench_context(args) -> dict:
+    actions = ["add detailed comments", "generate professional-level documentation",
+               "refactor this code for readability and efficiency"]
+    report = {}
+    for label, cached in (("full", False), ("cached", True)):
+        client = make_mock_client(prefill_chars_per_second=args.prefill_rate, **mock_options(args))
+        if not cached:
+            client.context_cache = None
+        elif client.context_cache:
+            # The mock has no minimum cacheable size
+            client.context_cache.min_tokens = 0
+        prefix = client.build_persona_prefix(SAMPLE_CODE)
+        latencies = []
+        for action in actions:
+            started = time.monotonic()
+            client.generate(client.build_persona_prompt(action, SAMPLE_CODE), prefix=prefix)
+            latencies.append(time.monotonic() - started)
+        uploaded = client.context_cache.backend.uploaded_chars if cached and client.context_cache else 0
+        report[f"context_chars_sent_{label}"] = (client.model.prompt_chars + uploaded) / len(actions)
+        report[f"context_latency_{label}"] = sum(latencies) / len(latencies)
+    return report
+
+
+def bench_diff(args) -> dict:
+    from diff_view import diff_lines
+    source = "".join(
+        f"def function_{i}(values):\n    total = 0\n    for value in values:\n        total += value * {i}\n"
+        f"    return total\n\n" for i in range(args.diff_lines // 6 + 1)
+    )
+    lines = source.splitlines(keepends=True)[:args.diff_lines]
+    source = "".join(lines)
+    # "Add comments": a comment line before every fifth line
+    commented = "".join((f"    # Step {i}\n" if i % 5 == 0 else "") + line for i, line in enumerate(lines))
+    rewritten = source.replace("total", "result").replace("values", "items")
+    report = {}
+    for label, other in (("comments", commented), ("rewrite", rewritten)):
+        started = time.perf_counter()
+        rows = diff_lines(source, other)
+        report[f"diff_seconds_{label}"] = time.perf_counter() - started
+        report[f"diff_rows_{label}"] = len(rows)
+    return report
+
+
+def bench_chunks(args) -> dict:
+    from chunker import split_code
+
+    def function(i, extra=0):
+        body = "".join(f"    total += value * {i + k}\n" for k in range(10 + i % 40 + extra))
+        return f"def function_{i}(values):\n    total = 0\n    for value in values:\n{body}    return total\n\n\n"
+
+    count = 200
+    edited = count // 2
+    source = "import os\n\n\n" + "".join(function(i) for i in range(count))
+    changed = "import os\n\n\n" + "".join(function(i, 60 if i == edited else 0) for i in range(count))
+    before = split_code(source, "bench.py", max_lines=200)
+    after = split_code(changed, "bench.py", max_lines=200)
+    resubmitted = [chunk for chunk in after if chunk not in before]
+    return {
+        "chunks_total": len(after),
+        "chunks_resubmitted": len(resubmitted),
+        "chunks_other_changed": sum(1 for chunk in resubmitted if f"def function_{edited}(" not in chunk),
+    }
+
+
+def import_times(module: str) -> list:
+    """(module, self seconds, cumulative seconds) for every import made by importing module, from -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (.+)$", line)
+        if match:
+            rows.append((match.group(3).strip(), int(match.group(1)) / 1e6, int(match.group(2)) / 1e6))
+    return rows
+
+
+def bench_startup(args, gui: bool) -> dict:
+    rows = import_times("app")
+    print("Slowest imports under 'import app' (cumulative seconds):", file=sys.stderr)
+    for name, _, cumulative in sorted(rows, key=lambda row: row[2], reverse=True)[1:args.import_report + 1]:
+        print(f"  {cumulative:8.3f}  {name}", file=sys.stderr)
+    report = {
+        "import_app_seconds": next((row[2] for row in rows if row[0] == "app"), None),
+        # The SDK is meant to load in the background, never on the startup path
+        "genai_imported_at_startup": int(any(row[0] == "google.generativeai" for row in rows)),
+    }
+    if gui:
+        started = time.time()
+        result = subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(root=ROOT)], cwd=ROOT,
+                                capture_output=True, text=True, timeout=120)
+        marks = dict(line.split() for line in result.stdout.splitlines() if line.startswith(("window", "ready")))
+        if "window" in marks:
+            report["time_to_first_window"] = float(marks["window"]) - started
+        if "ready" in marks:
+            report["time_to_model_ready"] = float(marks["ready"]) - started
+    return report
+
+
+def bench_jobs(args) -> dict:
+    client = make_mock_client(**mock_options(args))
+    scheduler = JobScheduler(max_workers=args.concurrency, default_timeout=None)
+    started = time.monotonic()
+    jobs = [
+        scheduler.submit(f"job {i}", lambda job, i=i: "".join(
+            client.generate_content_stream(client.build_persona_prompt(f"benchmark action {i}", SAMPLE_CODE))))
+        for i in range(args.jobs)
+    ]
+    for job in jobs:
+        job.wait()
+    elapsed = time.monotonic() - started
+    scheduler.shutdown()
+    latencies = [job.finished_at - job.submitted_at for job in jobs]
+    return {
+        "jobs_per_second": len(jobs) / elapsed,
+        "job_latency_p50": percentile(latencies, 50),
+        "job_latency_p95": percentile(latencies, 95),
+        "jobs_failed": sum(1 for job in jobs if job.state != DONE),
+        "mock_calls": client.model.calls,
+    }
+
+
+class StallMonitor:  # Measures how late Tk timer callbacks fire while the app works
+    INTERVAL_MS = 10
+
+    def __init__(self, root):
+        self.root = root
+        self.max_stall = 0.0
+        self.total_stall = 0.0
+        self._expected = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._expected = time.monotonic() + self.INTERVAL_MS / 1000
+        self.root.after(self.INTERVAL_MS, self._beat)
+
+    def stop(self):
+        self._running = False
+
+    def _beat(self):
+        if not self._running:
+            return
+        now = time.monotonic()
+        lateness = max(0.0, now - self._expected)
+        self.max_stall = max(self.max_stall, lateness)
+        # Lateness below a frame (~16 ms) is scheduling noise, not a visible stall
+        if lateness > 0.016:
+            self.total_stall += lateness
+        self._expected = now + self.INTERVAL_MS / 1000
+        self.root.after(self.INTERVAL_MS, self._beat)
+
+
+def ensure_display():
+    """Returns a started Xvfb process (to terminate later), True if a display exists, or None."""
+    if sys.platform in ("win32", "darwin") or os.environ.get("DISPLAY"):
+        return True
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        return None
+    display = ":97"
+    process = subprocess.Popen([xvfb, display, "-screen", "0", "1600x900x24"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)
+    os.environ["DISPLAY"] = display
+    return process
+
+
+def pump_until(app, condition, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark step did not finish in time")
+        app.update()
+        time.sleep(0.002)
+
+
+def bench_history(args) -> dict:
+    from history import RefinementHistoryPanel
+    import customtkinter as ctk
+
+    root = ctk.CTk()
+    root.withdraw()
+    panel = RefinementHistoryPanel(root)
+    panel.grid(row=0, column=0, sticky="nsew")
+    text = SAMPLE_CODE * 3
+    timings = []
+    blocked = []
+    for i in range(args.history_steps):
+        started = time.perf_counter()
+        panel.add_refinement(text + f"# step {i}\n")
+        blocked.append(time.perf_counter() - started)
+        # Steps are saved on the store's writer thread and shown when it reports back
+        pump_until(root, lambda: len(panel.refinement_history) == i + 1)
+        timings.append(time.perf_counter() - started)
+    panel.clear_history()
+    root.destroy()
+    quarter = max(1, len(timings) // 4)
+    return {
+        "history_add_first_ms": sum(timings[:quarter]) / quarter * 1000,
+        "history_add_last_ms": sum(timings[-quarter:]) / quarter * 1000,
+        "history_ui_block_max_ms": max(blocked) * 1000,
+    }
+
+
+def bench_app(args) -> dict:
+    from app import CodeAssistantApp
+
+    client = make_mock_client(**mock_options(args))
+    app = CodeAssistantApp(api_client=client)
+    app.withdraw()
+    finished = []
+    on_job_done = app._on_job_done
+
+    def record_done(job):
+        on_job_done(job)
+        finished.append(job)
+
+    app._on_job_done = record_done
+    app.input_textbox.delete("1.0", "end")
+    app.input_textbox.insert("1.0", SAMPLE_CODE)
+    app.input_has_placeholder = False
+
+    monitor = StallMonitor(app)
+    monitor.start()
+    tracemalloc.start()
+
+    latencies = []
+    started = time.monotonic()
+    app.process_code("add detailed comments")
+    pump_until(app, lambda: len(finished) == 1)
+    latencies.append(time.monotonic() - started)
+    memory_start = tracemalloc.get_traced_memory()[0]
+
+    for i in range(args.refinements):
+        started = time.monotonic()
+        app.refine_last_output(f"benchmark refinement {i}")
+        pump_until(app, lambda: len(finished) == i + 2)
+        latencies.append(time.monotonic() - started)
+
+    memory_end = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    monitor.stop()
+    app.scheduler.shutdown()
+    app.destroy()
+    return {
+        "app_latency_p50": percentile(latencies, 50),
+        "app_latency_p95": percentile(latencies, 95),
+        "event_loop_stall_total": monitor.total_stall,
+        "event_loop_stall_max": monitor.max_stall,
+        "memory_growth_per_refinement_kb": (memory_end - memory_start) / max(1, args.refinements) / 1024,
+        "jobs_failed": sum(1 for job in finished if job.state != DONE),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for scenario, values in report.items():
+        for key, value in values.items():
+            base = baseline.get(scenario, {}).get(key)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / base
+            worse = change < -tolerance if key in HIGHER_IS_BETTER else change > tolerance
+            if worse:
+                regressions.append(f"{scenario}.{key}: {base:.4g} -> {value:.4g} ({change:+.0%})")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scenario", action="append", choices=["jobs", "context", "diff", "chunks", "startup",
+                                                               "history", "app"],
+                        help="Scenario to run; repeatable (default: all)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock time to first chunk, seconds")
+    parser.add_argument("--rate", type=float, default=4000, help="Mock streaming rate, chars/second")
+    parser.add_argument("--prefill-rate", type=float, default=50000,
+                        help="Mock prompt processing rate for the context scenario, chars/second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock fraction of failing calls")
+    parser.add_argument("--output-chars", type=int, default=None, help="Mock response size (default: echo)")
+    parser.add_argument("--jobs", type=int, default=20, help="Jobs in the concurrency scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Scheduler workers in the jobs scenario")
+    parser.add_argument("--refinements", type=int, default=10, help="Refinements in the app scenario")
+    parser.add_argument("--diff-lines", type=int, default=5000, help="Lines per side in the diff scenario")
+    parser.add_argument("--history-steps", type=int, default=100, help="Steps in the history scenario")
+    parser.add_argument("--startup-budget", type=float, default=2.0,
+                        help="Max seconds from launch to first window in the startup scenario (default: 2.0)")
+    parser.add_argument("--import-report", type=int, default=15, help="Slowest imports to list (default: 15)")
+    parser.add_argument("--baseline", help="Compare against this baseline report")
+    parser.add_argument("--save-baseline", help="Write the report to this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    scenarios = args.scenario or ["jobs", "context", "diff", "chunks", "startup", "history", "app"]
+    report = {}
+    failed = False
+
+    if "jobs" in scenarios:
+        report["jobs"] = bench_jobs(args)
+    if "context" in scenarios:
+        report["context"] = bench_context(args)
+    if "diff" in scenarios:
+        report["diff"] = bench_diff(args)
+    if "chunks" in scenarios:
+        report["chunks"] = bench_chunks(args)
+        if report["chunks"]["chunks_other_changed"]:
+            print(f"Chunk boundaries moved: {report['chunks']['chunks_other_changed']} chunks without the edit "
+                  f"changed", file=sys.stderr)
+            failed = True
+
+    gui_scenarios = [name for name in ("startup", "history", "app") if name in scenarios]
+    if gui_scenarios:
+        display = ensure_display()
+        if display is None:
+            print(f"No display available; skipping GUI measurements of {', '.join(gui_scenarios)}.", file=sys.stderr)
+            if "startup" in gui_scenarios:
+                report["startup"] = bench_startup(args, gui=False)
+        else:
+            try:
+                if "startup" in gui_scenarios:
+                    report["startup"] = bench_startup(args, gui=True)
+                    first_window = report["startup"].get("time_to_first_window")
+                    if first_window is not None and first_window > args.startup_budget:
+                        print(f"Startup budget exceeded: first window after {first_window:.2f} s "
+                              f"(budget {args.startup_budget:.2f} s)", file=sys.stderr)
+                        failed = True
+                if "history" in gui_scenarios:
+                    report["history"] = bench_history(args)
+                if "app" in gui_scenarios:
+                    report["app"] = bench_app(args)
+            finally:
+                if display is not True:
+                    display.terminate()
+
+    print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}", file=sys.stderr)
+        return 1 if regressions or failed else 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
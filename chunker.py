@@ -0,0 +1,172 @@
+# chunker.py
+# Splits large inputs at top-level definition boundaries and processes the pieces concurrently.
+
+import ast
+import re
+import zlib
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+from patching import strip_fences
+
+PYTHON_EXTENSIONS = (".py", ".pyw", ".pyi")
+
+# Top-level declarations in common brace/keyword languages, used when the input isn't Python
+_DEFINITION_RE = re.compile(
+    r"^(export\s+)?(default\s+)?(public\s+|private\s+|protected\s+|internal\s+)?(static\s+)?(async\s+)?"
+    r"(def|class|function|fn|func|interface|struct|enum|impl|trait|module|namespace|type|const|let|var)\b"
+)
+
+
+def is_python(code: str, filename: Optional[str] = None) -> bool:
+    if filename:
+        return filename.lower().endswith(PYTHON_EXTENSIONS)
+    try:
+        ast.parse(code)
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+
+def split_code(code: str, filename: Optional[str] = None, max_lines: int = 200) -> List[str]:
+    """Split code into chunks at top-level function/class boundaries, so "".join(chunks) == code.
+
+    Neighbouring sections are merged, and whether a chunk starts at a definition depends only on
+    that definition (see _starts_chunk), not on where earlier chunks ended. Editing one function
+    changes the chunks around it; the others stay byte-identical and are answered from the
+    response cache. Chunks average about max_lines / 2 lines and are only cut short by the
+    max_lines limit.
+    """
+    lines = code.splitlines(keepends=True)
+    if len(lines) <= max_lines:
+        return [code] if code else []
+
+    boundaries = None
+    if is_python(code, filename):
+        boundaries = _python_boundaries(code, lines)
+    if boundaries is None:
+        boundaries = _line_boundaries(lines)
+
+    sections = []
+    starts = sorted(set([0] + [b for b in boundaries if 0 < b < len(lines)]))
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        sections.append(lines[start:end])
+
+    chunks = []
+    current = []
+    for section in sections:
+        if current and (len(current) + len(section) > max_lines or _starts_chunk(section, max_lines)):
+            chunks.append("".join(current))
+            current = []
+        # A single oversized section is hard-split so no request exceeds the limit by much
+        while len(section) > max_lines * 2:
+            if current:
+                chunks.append("".join(current))
+                current = []
+            chunks.append("".join(section[:max_lines]))
+            section = section[max_lines:]
+        current.extend(section)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _starts_chunk(section: List[str], max_lines: int) -> bool:
+    # Content-defined split point: a top-level section starts a chunk when the hash of its first
+    # code line falls below a threshold proportional to its length, so chunks hold about
+    # max_lines / 2 lines whatever the section sizes
+    if not section or section[0][:1] in (" ", "\t"):
+        return False
+    header = next((line.strip() for line in section if line.strip() and not line.lstrip().startswith("#")), "")
+    if not header:
+        return False
+    return zlib.crc32(header.encode("utf-8")) % max(1, max_lines) < 2 * len(section)
+
+
+def _python_boundaries(code: str, lines: List[str]) -> Optional[List[int]]:
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    boundaries = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list]) - 1
+        # Keep comments directly above a definition together with it
+        while start > 0 and lines[start - 1].lstrip().startswith("#"):
+            start -= 1
+        boundaries.append(start)
+        # Whatever follows a definition starts a new section
+        if node.end_lineno is not None:
+            boundaries.append(node.end_lineno)
+    return boundaries
+
+
+def _line_boundaries(lines: List[str]) -> List[int]:
+    boundaries = []
+    previous_closed_block = False
+    for i, line in enumerate(lines):
+        at_top_level = line[:1] not in ("", " ", "\t", "\n", "\r")
+        if at_top_level and (_DEFINITION_RE.match(line) or previous_closed_block):
+            boundaries.append(i)
+        if line.strip():
+            previous_closed_block = at_top_level and line.strip().startswith("}")
+    return boundaries
+
+
+def _trailing_blank_lines(text: str) -> str:
+    newline = text.find("\n", len(text.rstrip()))
+    return text[newline:] if newline != -1 else ""
+
+
+def join_chunks(results: List[str], chunks: List[str]) -> str:
+    """Reassemble the results for chunks. The blank lines separating definitions end a chunk and
+    models drop trailing whitespace, so each result gets its chunk's trailing blank lines back."""
+    parts = []
+    for text, chunk in zip(results, chunks):
+        if parts and parts[-1] and not parts[-1].endswith("\n"):
+            parts[-1] += "\n"
+        parts.append(text.rstrip() + _trailing_blank_lines(chunk) if text.strip() else text)
+    return "".join(parts)
+
+
+class ChunkedProcessor:  # Runs one action over many chunks through a bounded worker pool
+    def __init__(self, api_client, max_workers: int = 4):
+        self.api_client = api_client
+        self.max_workers = max_workers
+
+    def run(self, action: str, chunks: List[str],
+            on_progress: Optional[Callable[[int, int], None]] = None,
+            cancelled: Optional[Callable[[], bool]] = None, model: Optional[str] = None) -> Optional[str]:
+        """Apply action to every chunk concurrently and reassemble the results in order.
+
+        Unchanged chunks produce identical prompts, so on a later run they are answered by the
+        client's response cache and only the edited chunks reach the API.
+        Returns None if cancelled() becomes true; chunks not yet started are dropped.
+        Raises GeminiAPIError if any chunk fails after the client's retries.
+        """
+        results = [""] * len(chunks)
+        done = 0
+        pool = ThreadPoolExecutor(max_workers=max(1, self.max_workers))
+        try:
+            futures = {
+                pool.submit(self.api_client.generate,
+                            self.api_client.build_chunk_prompt(action, chunk), model, None, cancelled): i
+                for i, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                if cancelled and cancelled():
+                    return None
+                try:
+                    i = futures[future]
+                    results[i] = strip_fences(future.result(), chunks[i])
+                except CancelledError:
+                    return None
+                done += 1
+                if on_progress:
+                    on_progress(done, len(chunks))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return join_chunks(results, chunks)
@@ -0,0 +1,37 @@
+# config.py
+# Shared helpers for reading optional settings from the environment (.env is loaded by the entry point).
+
+import os
+
+
+def data_dir() -> str:
+    """Directory for CodeAssistant's local state (caches, history, traces). Created on demand."""
+    path = os.environ.get("CODEASSISTANT_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".codeassistant")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_list(name: str) -> list:
+    # Comma-separated values, blanks dropped
+    return [item.strip() for item in os.environ.get(name, "").split(",") if item.strip()]
@@ -0,0 +1,131 @@
+# context_cache.py
+# Server-side context caching for prompt prefixes (persona, constraints and the current input code),
+# so follow-up actions on the same code upload only their instruction.
+
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import estimate_tokens, get_recorder
+
+
+class GenaiContextBackend:  # Creates and uses google.generativeai cached contents
+    def create(self, model_name: str, text: str, ttl: datetime.timedelta):
+        from google.generativeai import caching
+        return caching.CachedContent.create(model=model_name, contents=[text], ttl=ttl)
+
+    def model(self, handle):
+        import google.generativeai as genai
+        return genai.GenerativeModel.from_cached_content(handle)
+
+    def delete(self, handle):
+        handle.delete()
+
+
+class ContextCache:
+    """Maps (model, prefix) to a model bound to a server-side cache of that prefix.
+
+    Prefixes shorter than min_tokens are not cached (the API has a minimum size, and small prefixes
+    aren't worth it). A prefix whose cache creation failed is sent in full until RETRY_TRANSIENT
+    (rate limits, outages) or RETRY_FATAL seconds have passed; failures are recorded as
+    "context_cache" spans. Entries are reused until shortly before their TTL runs out and the least
+    recently used are deleted above max_entries. Caches are created outside the lock, so an upload
+    never holds up other requests; concurrent requests for a prefix being uploaded send it in full.
+    """
+
+    # Entries this close to expiry are recreated rather than risk expiring mid-request
+    EXPIRY_MARGIN = 30
+    RETRY_TRANSIENT = 60
+    RETRY_FATAL = 3600
+
+    def __init__(self, backend=None, ttl: float = 600, min_tokens: int = 4096, max_entries: int = 8,
+                 metrics=None):
+        self.backend = backend or GenaiContextBackend()
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.metrics = metrics or get_recorder()
+        self.hits = 0
+        self.created = 0
+        self.failures = 0
+        self._entries = OrderedDict()  # key -> (handle, model, expires_at)
+        self._failed = {}  # key -> monotonic time after which creation is tried again
+        self._creating = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model_name: str, prefix: str):
+        return model_name, hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    def model_for(self, model_name: str, prefix: str):
+        """A model that already holds prefix, or None to send the full prompt instead."""
+        if estimate_tokens(len(prefix)) < self.min_tokens:
+            return None
+        key = self._key(model_name, prefix)
+        with self._lock:
+            if self._failed.get(key, 0) > time.monotonic() or key in self._creating:
+                return None
+            entry = self._entries.get(key)
+            if entry and entry[2] - self.EXPIRY_MARGIN > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._creating.add(key)
+        try:
+            # The SDK takes an int, a timedelta or a dict as TTL and rejects floats
+            handle = self.backend.create(model_name, prefix, datetime.timedelta(seconds=self.ttl))
+            model = self.backend.model(handle)
+        except Exception as e:
+            self._on_failure(key, model_name, e)
+            return None
+        with self._lock:
+            self._creating.discard(key)
+            self._failed.pop(key, None)
+            self.created += 1
+            stale = self._entries.pop(key, None)
+            evicted = [stale[0]] if stale else []
+            self._entries[key] = (handle, model, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1][0])
+        for handle in evicted:
+            self._delete(handle)
+        return model
+
+    def _on_failure(self, key, model_name: str, error: Exception):
+        # Imported here: api_client imports this module
+        from api_client import classify_error, FATAL
+        transient = classify_error(error) != FATAL
+        with self._lock:
+            self._creating.discard(key)
+            self.failures += 1
+            self._failed[key] = time.monotonic() + (self.RETRY_TRANSIENT if transient else self.RETRY_FATAL)
+        self.metrics.record("context_cache", model=model_name, status="error", transient=transient,
+                            error=f"{type(error).__name__}: {error}"[:300])
+
+    def clear(self):
+        with self._lock:
+            handles = [entry[0] for entry in self._entries.values()]
+            self._entries.clear()
+            self._failed.clear()
+        for handle in handles:
+            self._delete(handle)
+
+    def _delete(self, handle):
+        # Best effort: the server drops the cache at its TTL anyway
+        try:
+            self.backend.delete(handle)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "created": self.created,
+                    "failures": self.failures}
+
+
+def prefix_of(prompt: str, prefix: Optional[str]) -> Optional[str]:
+    # Only a true prefix of the prompt can be served from a cache
+    return prefix if prefix and prompt.startswith(prefix) and len(prefix) < len(prompt) else None
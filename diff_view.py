@@ -0,0 +1,248 @@
+# diff_view.py
+# Side-by-side diff of any two texts (input, output, history steps). Diffs are computed on a worker
+# thread, cached per text pair, and highlighted only for the rows currently scrolled into view.
+
+import difflib
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+import customtkinter as ctk
+from line_diff import line_opcodes
+from theme import Theme
+
+_TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+class DiffRow(NamedTuple):
+    tag: str  # "equal", "delete", "insert" or "replace"
+    left_no: Optional[int]
+    left: Optional[str]
+    right_no: Optional[int]
+    right: Optional[str]
+
+
+def diff_lines(a: str, b: str) -> List[DiffRow]:
+    """Line diff aligned for side-by-side display. Lines are interned to ints first, so the
+    diff compares small integers instead of re-hashing strings."""
+    a_lines = a.splitlines()
+    b_lines = b.splitlines()
+    table = {}
+    a_ids = [table.setdefault(line, len(table)) for line in a_lines]
+    b_ids = [table.setdefault(line, len(table)) for line in b_lines]
+
+    rows = []
+    for tag, i1, i2, j1, j2 in line_opcodes(a_ids, b_ids):
+        if tag == "equal":
+            rows.extend(DiffRow("equal", i + 1, a_lines[i], j + 1, b_lines[j])
+                        for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+        for k in range(max(i2 - i1, j2 - j1)):
+            i, j = i1 + k, j1 + k
+            left = (i + 1, a_lines[i]) if i < i2 else (None, None)
+            right = (j + 1, b_lines[j]) if j < j2 else (None, None)
+            row_tag = "replace" if left[0] and right[0] else ("delete" if left[0] else "insert")
+            rows.append(DiffRow(row_tag, left[0], left[1], right[0], right[1]))
+    return rows
+
+
+def token_changes(left: str, right: str):
+    """Character spans that differ between two changed lines, as (left_spans, right_spans)."""
+    a = _TOKEN_RE.findall(left)
+    b = _TOKEN_RE.findall(right)
+    a_offsets = [0]
+    for token in a:
+        a_offsets.append(a_offsets[-1] + len(token))
+    b_offsets = [0]
+    for token in b:
+        b_offsets.append(b_offsets[-1] + len(token))
+    left_spans, right_spans = [], []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes():
+        if tag == "equal":
+            continue
+        if i2 > i1:
+            left_spans.append((a_offsets[i1], a_offsets[i2]))
+        if j2 > j1:
+            right_spans.append((b_offsets[j1], b_offsets[j2]))
+    return left_spans, right_spans
+
+
+class DiffCache:  # Bounded LRU of computed diffs keyed by the content of both sides
+    def __init__(self, size: int = 16):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, a: str, b: str) -> List[DiffRow]:
+        key = (hashlib.sha1(a.encode("utf-8")).digest(), hashlib.sha1(b.encode("utf-8")).digest())
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        rows = diff_lines(a, b)
+        with self._lock:
+            self._items[key] = rows
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return rows
+
+
+class DiffWindow(ctk.CTkToplevel):
+    """get_sources() is called on the Tk thread and returns {label: text or loader}; loaders run on
+    the diff worker thread, so they must be thread-safe (e.g. history store reads)."""
+
+    GUTTER = 6
+    HIGHLIGHT_BLOCK = 200
+    POLL_MS = 80
+
+    def __init__(self, parent, get_sources: Callable[[], dict], cache: DiffCache,
+                 left: str = "Input", right: str = "Output"):
+        super().__init__(parent, fg_color=Theme.FRAME_BG)
+        self.title("Compare")
+        self.geometry("1200x700")
+        self.get_sources = get_sources
+        self.cache = cache
+        self.rows = []
+        self._highlighted = set()
+        self._generation = 0
+        self._last_views = (None, None)
+
+        self.grid_columnconfigure((0, 1), weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        controls = ctk.CTkFrame(self, fg_color="transparent")
+        controls.grid(row=0, column=0, columnspan=2, sticky="ew", padx=10, pady=10)
+        labels = list(get_sources())
+        self.left_menu = ctk.CTkOptionMenu(controls, values=labels, command=lambda _value: self.compare(),
+                                           fg_color=Theme.TEXT_INPUT_BG, button_color=Theme.BLUE,
+                                           button_hover_color=Theme.BLUE_HOVER)
+        self.left_menu.grid(row=0, column=0, padx=(0, 10))
+        self.left_menu.set(left if left in labels else labels[0])
+        self.right_menu = ctk.CTkOptionMenu(controls, values=labels, command=lambda _value: self.compare(),
+                                            fg_color=Theme.TEXT_INPUT_BG, button_color=Theme.BLUE,
+                                            button_hover_color=Theme.BLUE_HOVER)
+        self.right_menu.grid(row=0, column=1, padx=(0, 10))
+        self.right_menu.set(right if right in labels else labels[-1])
+        ctk.CTkButton(controls, text="Refresh", width=80, command=self.refresh,
+                      fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER).grid(row=0, column=2, padx=(0, 10))
+        self.status_label = ctk.CTkLabel(controls, text="", font=("Consolas", 11), text_color=Theme.TEXT)
+        self.status_label.grid(row=0, column=3, sticky="w")
+
+        self.left_box = self._make_textbox()
+        self.left_box.grid(row=1, column=0, sticky="nsew", padx=(10, 5), pady=(0, 10))
+        self.right_box = self._make_textbox()
+        self.right_box.grid(row=1, column=1, sticky="nsew", padx=(5, 10), pady=(0, 10))
+
+        self.compare()
+        self.after(self.POLL_MS, self._poll_scroll)
+
+    def _make_textbox(self) -> ctk.CTkTextbox:
+        box = ctk.CTkTextbox(self, font=("Consolas", 11), wrap="none", border_width=2,
+                             fg_color=Theme.TEXT_INPUT_BG, text_color=Theme.TEXT)
+        box.tag_config("delete", background=Theme.DIFF_DELETE_BG)
+        box.tag_config("insert", background=Theme.DIFF_INSERT_BG)
+        box.tag_config("replace", background=Theme.DIFF_CHANGE_BG)
+        box.tag_config("filler", background=Theme.STEP_BG)
+        box.tag_config("token", background=Theme.DIFF_TOKEN_BG)
+        box.tag_config("gutter", foreground="#6c7a89")
+        box.tag_raise("token")
+        return box
+
+    def refresh(self):
+        labels = list(self.get_sources())
+        self.left_menu.configure(values=labels)
+        self.right_menu.configure(values=labels)
+        self.compare()
+
+    def compare(self):
+        sources = self.get_sources()
+        left = sources.get(self.left_menu.get())
+        right = sources.get(self.right_menu.get())
+        if left is None or right is None:
+            self.status_label.configure(text="Selection no longer available.")
+            return
+        self._generation += 1
+        self.status_label.configure(text="Computing diff...")
+        threading.Thread(target=self._diff_worker, args=(self._generation, left, right), daemon=True).start()
+
+    def _diff_worker(self, generation: int, left, right):
+        try:
+            a = left() if callable(left) else left
+            b = right() if callable(right) else right
+            rows = self.cache.get_or_compute(a, b)
+        except Exception as e:
+            self.after(0, self._show_status, generation, f"Error: {e}")
+            return
+        self.after(0, self._render, generation, rows)
+
+    def _show_status(self, generation: int, text: str):
+        if generation == self._generation:
+            self.status_label.configure(text=text)
+
+    def _render(self, generation: int, rows: List[DiffRow]):
+        # A newer comparison was requested while this one was computing
+        if generation != self._generation:
+            return
+        self.rows = rows
+        self._highlighted = set()
+        blank = " " * self.GUTTER
+        left = "\n".join(blank if r.left_no is None else f"{r.left_no:>{self.GUTTER - 1}} {r.left}" for r in rows)
+        right = "\n".join(blank if r.right_no is None else f"{r.right_no:>{self.GUTTER - 1}} {r.right}" for r in rows)
+        for box, text in ((self.left_box, left), (self.right_box, right)):
+            box.configure(state="normal")
+            box.delete("1.0", "end")
+            box.insert("1.0", text)
+            box.configure(state="disabled")
+            box.yview_moveto(0)
+
+        removed = sum(1 for r in rows if r.tag == "delete")
+        added = sum(1 for r in rows if r.tag == "insert")
+        changed = sum(1 for r in rows if r.tag == "replace")
+        self.status_label.configure(text=f"+{added}  -{removed}  ~{changed} lines")
+        self._last_views = (None, None)
+        self._highlight_visible()
+
+    def _poll_scroll(self):
+        # Keep both panes aligned and highlight whatever has scrolled into view
+        try:
+            left_view = self.left_box.yview()
+            right_view = self.right_box.yview()
+        except Exception:
+            return
+        last_left, last_right = self._last_views
+        if left_view != last_left and last_left is not None:
+            self.right_box.yview_moveto(left_view[0])
+        elif right_view != last_right and last_right is not None:
+            self.left_box.yview_moveto(right_view[0])
+        self._last_views = (self.left_box.yview(), self.right_box.yview())
+        self._highlight_visible()
+        self.after(self.POLL_MS, self._poll_scroll)
+
+    def _highlight_visible(self):
+        if not self.rows:
+            return
+        first = int(self.left_box.index("@0,0").split(".")[0]) - 1
+        last = int(self.left_box.index(f"@0,{self.left_box.winfo_height()}").split(".")[0]) - 1
+        for block in range(first // self.HIGHLIGHT_BLOCK, last // self.HIGHLIGHT_BLOCK + 1):
+            if block not in self._highlighted:
+                self._highlighted.add(block)
+                self._highlight_block(block)
+
+    def _highlight_block(self, block: int):
+        start = block * self.HIGHLIGHT_BLOCK
+        for index, row in enumerate(self.rows[start:start + self.HIGHLIGHT_BLOCK], start=start + 1):
+            for box in (self.left_box, self.right_box):
+                box.tag_add("gutter", f"{index}.0", f"{index}.{self.GUTTER}")
+            if row.tag == "equal":
+                continue
+            left_tag = "filler" if row.left_no is None else row.tag
+            right_tag = "filler" if row.right_no is None else row.tag
+            self.left_box.tag_add(left_tag, f"{index}.0", f"{index}.end")
+            self.right_box.tag_add(right_tag, f"{index}.0", f"{index}.end")
+            if row.tag == "replace":
+                left_spans, right_spans = token_changes(row.left, row.right)
+                for box, spans in ((self.left_box, left_spans), (self.right_box, right_spans)):
+                    for s, e in spans:
+                        box.tag_add("token", f"{index}.{self.GUTTER + s}", f"{index}.{self.GUTTER + e}")
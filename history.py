@@ -1,22 +1,104 @@
+import os
+import time
+from typing import Optional
+
 import customtkinter as ctk
 from theme import Theme
+from config import data_dir, env_flag
+from history_store import HistoryStore
+
+
+class HistoryStepView(ctk.CTkFrame):  # One history entry: collapsed preview, full text loaded on expand
+    def __init__(self, parent, number: int, preview: str, load_text):
+        super().__init__(parent, fg_color=Theme.STEP_BG)
+        self.load_text = load_text
+        self.content = None
+
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.pack(fill="x", padx=10, pady=(10, 0))
+        ctk.CTkLabel(
+            header, text=f"Refinement {number}:",
+            font=("Consolas", 12, "bold"),
+            text_color=Theme.TEXT
+        ).pack(side="left")
+        self.toggle_btn = ctk.CTkButton(
+            header, text="Expand", width=70, height=22,
+            command=self.toggle,
+            fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER
+        )
+        self.toggle_btn.pack(side="right")
+
+        self.preview = ctk.CTkLabel(
+            self, text=preview,
+            font=("Consolas", 10), text_color="#6c7a89",
+            justify="left", anchor="w"
+        )
+        self.preview.pack(fill="x", padx=10, pady=(0, 10))
+
+    def toggle(self):
+        if self.content is None:
+            # Build the textbox and rebuild the full text only when the step is opened
+            self.preview.pack_forget()
+            self.content = ctk.CTkTextbox(
+                self, font=("Consolas", 10),
+                fg_color=Theme.TEXT_INPUT_BG, text_color=Theme.TEXT,
+                wrap="word", border_width=2
+            )
+            self.content.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+            self.content.insert("1.0", self.load_text())
+            self.toggle_btn.configure(text="Collapse")
+        else:
+            self.content.destroy()
+            self.content = None
+            self.preview.pack(fill="x", padx=10, pady=(0, 10))
+            self.toggle_btn.configure(text="Expand")
 
 
 class RefinementHistoryPanel(ctk.CTkFrame):
+    # Only this many steps hold real widgets; older ones are reached by paging
+    VISIBLE_STEPS = 20
+
     def __init__(self, parent):
         super().__init__(parent, corner_radius=0, fg_color=Theme.FRAME_BG)
         self.grid_rowconfigure(1, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
+        # Steps live in the history store; the panel keeps only ids and previews
+        self.store = self._open_store()
+        self.session_id = None
         self.refinement_history = []
         self.refinement_count = 0
-        self.history_step_frames = []
+        # Materialized step widgets keyed by history index, and the first index of the visible window
+        self.history_step_frames = {}
+        self.window_start = 0
 
         self._create_widgets()
 
+    @staticmethod
+    def _open_store() -> HistoryStore:
+        try:
+            path = os.path.join(data_dir(), "history.sqlite3")
+        except OSError:
+            path = None
+        return HistoryStore.open_default(path, compress=env_flag("HISTORY_COMPRESS", True))
+
     def _create_widgets(self):
-        title = ctk.CTkLabel(self, text="Refinement History", font=ctk.CTkFont(size=16, weight="bold"))
-        title.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        header.grid_columnconfigure(0, weight=1)
+        title = ctk.CTkLabel(header, text="Refinement History", font=ctk.CTkFont(size=16, weight="bold"))
+        title.grid(row=0, column=0, sticky="w")
+
+        self.session_menu = ctk.CTkOptionMenu(
+            header, values=["Past sessions..."], width=150,
+            command=self._on_session_selected,
+            fg_color=Theme.TEXT_INPUT_BG, button_color=Theme.BLUE, button_hover_color=Theme.BLUE_HOVER,
+            dropdown_fg_color=Theme.FRAME_BG
+        )
+        self.session_menu.grid(row=0, column=1, sticky="e")
+        self.session_menu.bind("<Enter>", lambda _event: self._refresh_sessions())
+        self._session_labels = {}
+        self._refresh_sessions()
 
         self.history_scroll_frame = ctk.CTkScrollableFrame(
             self,
@@ -35,71 +117,150 @@ class RefinementHistoryPanel(ctk.CTkFrame):
         )
         self.history_placeholder.grid(row=0, column=0, pady=20)
 
+        # Paging controls, shown once the history outgrows the visible window
+        self.nav_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.nav_frame.grid_columnconfigure(1, weight=1)
+        self.older_btn = ctk.CTkButton(self.nav_frame, text="< Older", width=70, height=24,
+                                       command=self.show_older,
+                                       fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER)
+        self.older_btn.grid(row=0, column=0)
+        self.range_label = ctk.CTkLabel(self.nav_frame, text="", font=("Consolas", 10), text_color=Theme.TEXT)
+        self.range_label.grid(row=0, column=1)
+        self.newer_btn = ctk.CTkButton(self.nav_frame, text="Newer >", width=70, height=24,
+                                       command=self.show_newer,
+                                       fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER)
+        self.newer_btn.grid(row=0, column=2)
+
         self.clear_btn = ctk.CTkButton(
             self, text="Clear History",
             command=self.clear_history,
             fg_color=Theme.YELLOW, hover_color=Theme.YELLOW_HOVER,
             height=28
         )
-        self.clear_btn.grid(row=2, column=0, padx=10, pady=(0, 10))
+        self.clear_btn.grid(row=3, column=0, padx=10, pady=(0, 10))
 
     def add_refinement(self, text: str):
-        self.refinement_history.append(text)
+        if self.session_id is None:
+            # Sessions are created on first use so idle launches don't leave empty ones behind
+            self.session_id = self.store.create_session()
+        self.add_to_session(self.session_id, text)
+
+    def add_to_session(self, session_id: int, text: str):
+        """Save text as the next step of session_id. The delta and insert run on the store's writer
+        thread; the step is shown once it is saved if session_id is the panel's session by then,
+        including when it was loaded while the write was still pending."""
+        self.store.add_step_async(session_id, text, lambda step: self.after(0, self._on_step_added, session_id, step))
+
+    def _on_step_added(self, session_id: int, step):
+        # Skip steps of a session that was cleared or switched away from, or already listed by load_session
+        if session_id != self.session_id:
+            return
+        if self.refinement_history and self.refinement_history[-1].id >= step.id:
+            return
+        following_latest = self._window_end() == len(self.refinement_history)
+        self.refinement_history.append(step)
         self.refinement_count += 1
-        self._update_display()
+        index = len(self.refinement_history) - 1
+
+        if index == 0:
+            self.history_placeholder.grid_remove()
+        # While the newest steps are shown, materialize just the new one and retire the oldest,
+        # so each addition costs the same regardless of history length
+        if following_latest:
+            self._create_step(index)
+            if len(self.history_step_frames) > self.VISIBLE_STEPS:
+                self._destroy_step(self.window_start)
+                self.window_start += 1
+        self._update_nav()
+
+    def get_step_text(self, index: int) -> str:
+        return self.store.get_text(self.refinement_history[index].id)
 
     def clear_history(self):
-        self.refinement_history.clear()
+        if self.session_id is not None:
+            self.store.delete_session(self.session_id)
+            self.session_id = None
+        self._reset_display()
+
+    def load_session(self, session_id: Optional[int]):
+        """Reopen a stored session (None for a new, empty one); only step previews are read until a
+        step is expanded."""
+        self._reset_display()
+        self.session_id = session_id
+        if session_id is None:
+            return
+        self.refinement_history = self.store.steps(session_id)
+        self.refinement_count = len(self.refinement_history)
+        if self.refinement_history:
+            self.history_placeholder.grid_remove()
+        self.window_start = max(0, len(self.refinement_history) - self.VISIBLE_STEPS)
+        for index in range(self.window_start, self._window_end()):
+            self._create_step(index)
+        self._update_nav()
+
+    def _reset_display(self):
+        self.refinement_history = []
         self.refinement_count = 0
-        for frame in self.history_step_frames:
-            frame.destroy()
-        self.history_step_frames.clear()
+        for index in list(self.history_step_frames):
+            self._destroy_step(index)
+        self.window_start = 0
+        self.history_placeholder.grid()
+        self._update_nav()
 
-        self.history_placeholder = ctk.CTkLabel(
-            self.history_scroll_frame,
-            text="No refinements yet.\n\nClick 'Refine Last Output'\nto begin iterative refinement.",
-            font=("Consolas", 10),
-            text_color="#6c7a89"
-        )
-        self.history_placeholder.grid(row=0, column=0, pady=20)
+    def _refresh_sessions(self):
+        self._session_labels = {}
+        for session in self.store.list_sessions():
+            if session.id == self.session_id or not session.step_count:
+                continue
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(session.created))
+            self._session_labels[f"{created} ({session.step_count})"] = session.id
+        self.session_menu.configure(values=list(self._session_labels) or ["No past sessions"])
 
-    def _update_display(self):
-        for frame in self.history_step_frames:
-            frame.destroy()
-        self.history_step_frames.clear()
-
-        if not self.refinement_history:
-            self.history_placeholder = ctk.CTkLabel(
-                self.history_scroll_frame,
-                text="No refinements yet.\n\nClick 'Refine Last Output'\nto begin iterative refinement.",
-                font=("Consolas", 10),
-                text_color="#6c7a89"
-            )
-            self.history_placeholder.grid(row=0, column=0, pady=20)
+    def _on_session_selected(self, label: str):
+        session_id = self._session_labels.get(label)
+        self.session_menu.set("Past sessions...")
+        if session_id is not None:
+            self.load_session(session_id)
+
+    def show_older(self):
+        self._show_window(self.window_start - self.VISIBLE_STEPS)
+
+    def show_newer(self):
+        self._show_window(self.window_start + self.VISIBLE_STEPS)
+
+    def _show_window(self, start: int):
+        start = max(0, min(start, len(self.refinement_history) - self.VISIBLE_STEPS))
+        if start == self.window_start:
             return
+        for index in list(self.history_step_frames):
+            self._destroy_step(index)
+        self.window_start = start
+        for index in range(start, self._window_end()):
+            self._create_step(index)
+        self._update_nav()
 
-        for i, step in enumerate(self.refinement_history, start=1):
-            step_frame = ctk.CTkFrame(self.history_scroll_frame, fg_color=Theme.STEP_BG)
-            step_frame.grid(row=i-1, column=0, sticky="ew", padx=5, pady=5)
-            self.history_step_frames.append(step_frame)
+    def _window_end(self) -> int:
+        return min(self.window_start + self.VISIBLE_STEPS, len(self.refinement_history))
 
-            step_label = ctk.CTkLabel(
-                step_frame, text=f"Refinement {i}:",
-                font=("Consolas", 12, "bold"),
-                text_color=Theme.TEXT
-            )
-            step_label.pack(anchor="nw", padx=10, pady=(10, 0))
+    def _create_step(self, index: int):
+        step = self.refinement_history[index]
+        step_frame = HistoryStepView(self.history_scroll_frame, index + 1, step.preview,
+                                     lambda: self.store.get_text(step.id))
+        # Rows follow history indices, so existing steps never need re-gridding
+        step_frame.grid(row=index, column=0, sticky="ew", padx=5, pady=5)
+        self.history_step_frames[index] = step_frame
 
-            step_content = ctk.CTkTextbox(
-                step_frame, font=("Consolas", 10),
-                fg_color=Theme.TEXT_INPUT_BG, text_color=Theme.TEXT,
-                wrap="word", border_width=2
-            )
-            step_content.pack(fill="both", expand=True, padx=10, pady=(0, 10))
-            step_content.insert("1.0", step)
+    def _destroy_step(self, index: int):
+        frame = self.history_step_frames.pop(index, None)
+        if frame is not None:
+            frame.destroy()
 
-        # Ensure the scrollable frame updates its layout; avoid calling internal yview API
-        try:
-            self.history_scroll_frame.update_idletasks()
-        except Exception:
-            pass
+    def _update_nav(self):
+        total = len(self.refinement_history)
+        if total <= self.VISIBLE_STEPS:
+            self.nav_frame.grid_remove()
+            return
+        self.nav_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=(0, 5))
+        self.range_label.configure(text=f"{self.window_start + 1}-{self._window_end()} of {total}")
+        self.older_btn.configure(state="normal" if self.window_start > 0 else "disabled")
+        self.newer_btn.configure(state="normal" if self._window_end() < total else "disabled")
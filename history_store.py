@@ -0,0 +1,227 @@
+# history_store.py
+# Persistent refinement-history sessions. Steps are stored as line diffs against their parent,
+# with a full snapshot every few steps, and rebuilt only when a step is opened.
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+from line_diff import line_opcodes
+
+
+class StepInfo(NamedTuple):
+    id: int
+    seq: int
+    preview: str
+
+
+class SessionInfo(NamedTuple):
+    id: int
+    created: float
+    step_count: int
+
+
+def make_preview(text: str, max_lines: int = 3, width: int = 60) -> str:
+    lines = text.splitlines()
+    preview = [line[:width] + ("..." if len(line) > width else "") for line in lines[:max_lines]]
+    if len(lines) > max_lines:
+        preview.append(f"... ({len(lines)} lines)")
+    return "\n".join(preview)
+
+
+def make_delta(parent: str, text: str) -> list:
+    """Encode text as ops against parent: [start, end] copies parent lines, a string inserts text."""
+    a = parent.splitlines(keepends=True)
+    b = text.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in line_opcodes(a, b):
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return ops
+
+
+def apply_delta(parent: str, ops: list) -> str:
+    a = parent.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(a[op[0]:op[1]])
+    return "".join(parts)
+
+
+class HistoryStore:  # SQLite-backed store of refinement sessions
+    COMPRESS_MIN_BYTES = 256
+    TEXT_CACHE_SIZE = 8
+
+    def __init__(self, path: str, keyframe_interval: int = 10, compress: bool = True):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.compress = compress
+        self._lock = threading.Lock()
+        # Recently rebuilt texts, so opening neighbouring steps doesn't replay the whole chain
+        self._texts = OrderedDict()
+        # Steps handed to add_step_async, written in order by one daemon thread started on first use
+        self._writes = queue.Queue()
+        self._writer = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS steps ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,"
+            " parent_id INTEGER,"
+            " seq INTEGER NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " compressed INTEGER NOT NULL,"
+            " payload BLOB NOT NULL,"
+            " preview TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS steps_session ON steps (session_id, seq);"
+        )
+        self._conn.commit()
+
+    def create_session(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO sessions (created) VALUES (?)", (time.time(),))
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def list_sessions(self, limit: int = 20) -> List[SessionInfo]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.id, s.created, COUNT(st.id) FROM sessions s"
+                " LEFT JOIN steps st ON st.session_id = s.id"
+                " GROUP BY s.id ORDER BY s.id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [SessionInfo(*row) for row in rows]
+
+    def delete_session(self, session_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM steps WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+            self._texts.clear()
+
+    def steps(self, session_id: int) -> List[StepInfo]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, seq, preview FROM steps WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [StepInfo(*row) for row in rows]
+
+    def add_step(self, session_id: int, text: str) -> Optional[StepInfo]:
+        """Store text as the next step of session_id; None if the session was deleted meanwhile.
+        The delta against the parent is built without holding the lock."""
+        with self._lock:
+            parent_id, seq = self._last_step(session_id)
+            parent = self._get_text(parent_id) if parent_id is not None and seq % self.keyframe_interval else None
+
+        kind, body = "full", text
+        if parent is not None:
+            delta = json.dumps(make_delta(parent, text), separators=(",", ":"))
+            if len(delta) < len(text):
+                kind, body = "delta", delta
+        payload = body.encode("utf-8")
+        compressed = self.compress and len(payload) >= self.COMPRESS_MIN_BYTES
+        if compressed:
+            payload = zlib.compress(payload)
+        preview = make_preview(text)
+
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is None:
+                return None
+            if self._last_step(session_id) != (parent_id, seq):
+                # Another step was added meanwhile: store a snapshot rather than a delta on a stale parent
+                parent_id, seq = self._last_step(session_id)
+                kind, payload = "full", text.encode("utf-8")
+                compressed = self.compress and len(payload) >= self.COMPRESS_MIN_BYTES
+                if compressed:
+                    payload = zlib.compress(payload)
+            cursor = self._conn.execute(
+                "INSERT INTO steps (session_id, parent_id, seq, kind, compressed, payload, preview)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, parent_id, seq, kind, int(compressed), payload, preview),
+            )
+            self._conn.commit()
+            self._remember(cursor.lastrowid, text)
+            return StepInfo(cursor.lastrowid, seq, preview)
+
+    def add_step_async(self, session_id: int, text: str, on_done: Optional[Callable[[StepInfo], None]] = None):
+        """add_step on the store's writer thread; on_done(step) is called there once it is saved."""
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+        self._writes.put((session_id, text, on_done))
+
+    def _write_loop(self):
+        while True:
+            session_id, text, on_done = self._writes.get()
+            try:
+                step = self.add_step(session_id, text)
+            except sqlite3.Error:
+                step = None
+            if step is not None and on_done is not None:
+                on_done(step)
+
+    def _last_step(self, session_id: int):
+        last = self._conn.execute(
+            "SELECT id, seq FROM steps WHERE session_id = ? ORDER BY seq DESC LIMIT 1", (session_id,)
+        ).fetchone()
+        return (last[0], last[1] + 1) if last else (None, 0)
+
+    def get_text(self, step_id: int) -> str:
+        with self._lock:
+            return self._get_text(step_id)
+
+    def _get_text(self, step_id: int) -> str:
+        # Walk back to the nearest snapshot (or cached text), then replay deltas forward
+        chain = []
+        current = step_id
+        base = None
+        while current is not None:
+            if current in self._texts:
+                base = self._texts[current]
+                break
+            row = self._conn.execute(
+                "SELECT parent_id, kind, compressed, payload FROM steps WHERE id = ?", (current,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(step_id)
+            parent_id, kind, compressed, payload = row
+            body = (zlib.decompress(payload) if compressed else bytes(payload)).decode("utf-8")
+            if kind == "full":
+                base = body
+                break
+            chain.append(json.loads(body))
+            current = parent_id
+        text = base or ""
+        for ops in reversed(chain):
+            text = apply_delta(text, ops)
+        self._remember(step_id, text)
+        return text
+
+    def _remember(self, step_id: int, text: str):
+        self._texts[step_id] = text
+        self._texts.move_to_end(step_id)
+        while len(self._texts) > self.TEXT_CACHE_SIZE:
+            self._texts.popitem(last=False)
+
+    @staticmethod
+    def open_default(path: Optional[str], **kwargs) -> "HistoryStore":
+        """Open the store at path, falling back to an in-memory database if the file can't be used."""
+        if path:
+            try:
+                return HistoryStore(path, **kwargs)
+            except sqlite3.Error:
+                pass
+        return HistoryStore(":memory:", **kwargs)
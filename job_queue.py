@@ -0,0 +1,46 @@
+import customtkinter as ctk
+from theme import Theme
+
+
+class JobQueueView(ctk.CTkFrame):  # Lists queued/running jobs with a cancel button for each
+    def __init__(self, parent, on_cancel, on_cancel_all):
+        super().__init__(parent, fg_color="transparent")
+        self.on_cancel = on_cancel
+        self.grid_columnconfigure(0, weight=1)
+        self.job_rows = []
+
+        self.title_label = ctk.CTkLabel(self, text="Jobs", font=ctk.CTkFont(size=14, weight="bold"))
+        self.title_label.grid(row=0, column=0, sticky="w")
+        self.cancel_all_button = ctk.CTkButton(self, text="Cancel All", width=80, height=24,
+                                               command=on_cancel_all,
+                                               fg_color=Theme.YELLOW, hover_color=Theme.YELLOW_HOVER)
+        self.cancel_all_button.grid(row=0, column=1, sticky="e")
+
+        self.empty_label = ctk.CTkLabel(self, text="No jobs running.", font=("Consolas", 10),
+                                        text_color="#6c7a89")
+        self.empty_label.grid(row=1, column=0, columnspan=2, sticky="w")
+        self.update_jobs([])
+
+    def update_jobs(self, jobs):
+        for row in self.job_rows:
+            row.destroy()
+        self.job_rows.clear()
+
+        if not jobs:
+            self.empty_label.grid()
+            self.cancel_all_button.configure(state="disabled")
+            return
+        self.empty_label.grid_remove()
+        self.cancel_all_button.configure(state="normal")
+
+        for i, job in enumerate(jobs, start=1):
+            row = ctk.CTkFrame(self, fg_color=Theme.STEP_BG)
+            row.grid(row=i, column=0, columnspan=2, sticky="ew", pady=2)
+            row.grid_columnconfigure(0, weight=1)
+            label = job.label if len(job.label) <= 22 else job.label[:21] + "..."
+            ctk.CTkLabel(row, text=f"{label} ({job.state})", font=("Consolas", 10),
+                         text_color=Theme.TEXT, anchor="w").grid(row=0, column=0, padx=5, sticky="ew")
+            ctk.CTkButton(row, text="x", width=24, height=20,
+                          command=lambda j=job: self.on_cancel(j),
+                          fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER).grid(row=0, column=1, padx=5, pady=2)
+            self.job_rows.append(row)
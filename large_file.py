@@ -0,0 +1,162 @@
+# large_file.py
+# Keeps big files from freezing the UI: background reads (memory-mapped when very large),
+# chunked inserts spread across idle callbacks, and a read-only paged view above a size threshold.
+
+import mmap
+import os
+from typing import Callable, List, Optional
+
+import customtkinter as ctk
+from theme import Theme
+
+
+def read_text_file(path: str, mmap_threshold: int = 16 * 1024 * 1024) -> str:
+    """Read and decode a UTF-8 file; meant to run off the Tk thread."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        if size >= mmap_threshold:
+            # Decode straight from the mapping instead of copying the file into a bytes object first
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = str(mapped, "utf-8")
+        else:
+            text = file.read().decode("utf-8")
+    # Match text-mode reads, which the editors and prompt builders expect
+    return text.replace("\r\n", "\n")
+
+
+def split_pieces(text: str, size: int) -> List[str]:
+    """Split text into pieces of about size chars, ending on line breaks where possible."""
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            newline = text.find("\n", end)
+            end = len(text) if newline == -1 else newline + 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+class LargeTextView:
+    """Manages what a CTkTextbox shows: small texts are inserted directly, larger ones in chunks on
+    idle callbacks, and texts above paged_threshold as read-only pages with a navigation bar."""
+
+    def __init__(self, textbox: ctk.CTkTextbox, nav_parent, on_progress: Callable[[Optional[float]], None],
+                 chunk_chars: int = 64 * 1024, chunked_threshold: int = 256 * 1024,
+                 paged_threshold: int = 2 * 1024 * 1024, page_lines: int = 2000):
+        self.textbox = textbox
+        self.on_progress = on_progress
+        self.chunk_chars = chunk_chars
+        self.chunked_threshold = chunked_threshold
+        self.paged_threshold = paged_threshold
+        self.page_lines = page_lines
+        # Full text while loading or paged; None when the textbox itself holds the text
+        self.document = None
+        self.paged = False
+        self._line_starts = []
+        self._page = 0
+        self._pending = None
+
+        self.nav = ctk.CTkFrame(nav_parent, fg_color="transparent")
+        self.nav.grid_columnconfigure(1, weight=1)
+        self.prev_btn = ctk.CTkButton(self.nav, text="< Prev", width=70, height=24,
+                                      command=lambda: self.show_page(self._page - 1),
+                                      fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER)
+        self.prev_btn.grid(row=0, column=0)
+        self.page_label = ctk.CTkLabel(self.nav, text="", font=("Consolas", 10), text_color=Theme.TEXT)
+        self.page_label.grid(row=0, column=1)
+        self.next_btn = ctk.CTkButton(self.nav, text="Next >", width=70, height=24,
+                                      command=lambda: self.show_page(self._page + 1),
+                                      fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER)
+        self.next_btn.grid(row=0, column=2)
+
+    def get_text(self) -> str:
+        if self.document is not None:
+            return self.document
+        return self.textbox.get("1.0", "end-1c")
+
+    def set_text(self, text: str, on_done: Optional[Callable[[], None]] = None):
+        self._cancel_pending()
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", "end")
+        self.paged = False
+        self.nav.grid_remove()
+
+        if len(text) > self.paged_threshold:
+            self.document = text
+            self.paged = True
+            self._line_starts = self._index_lines(text)
+            self.nav.grid()
+            self.show_page(0)
+            self.on_progress(None)
+            if on_done:
+                on_done()
+        elif len(text) > self.chunked_threshold:
+            # Read-only until every chunk is in, so edits can't interleave with the load
+            self.document = text
+            self.textbox.configure(state="disabled")
+            self._insert_chunks(split_pieces(text, self.chunk_chars), 0, on_done)
+        else:
+            self.document = None
+            self.textbox.insert("1.0", text)
+            if on_done:
+                on_done()
+
+    def append(self, text: str):
+        """Append streamed text; only valid while the textbox holds the full text."""
+        if self.document is not None:
+            return
+        self.textbox.insert("end", text)
+        self.textbox.see("end")
+
+    def show_page(self, page: int):
+        pages = self.page_count()
+        page = max(0, min(page, pages - 1))
+        self._page = page
+        start = self._line_starts[page * self.page_lines]
+        end_line = (page + 1) * self.page_lines
+        end = self._line_starts[end_line] if end_line < len(self._line_starts) else len(self.document)
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", self.document[start:end])
+        self.textbox.configure(state="disabled")
+        self.page_label.configure(text=f"Read-only, page {page + 1} of {pages}")
+        self.prev_btn.configure(state="normal" if page > 0 else "disabled")
+        self.next_btn.configure(state="normal" if page < pages - 1 else "disabled")
+
+    def page_count(self) -> int:
+        return max(1, (len(self._line_starts) + self.page_lines - 1) // self.page_lines)
+
+    @staticmethod
+    def _index_lines(text: str) -> List[int]:
+        starts = [0]
+        position = text.find("\n")
+        while position != -1:
+            starts.append(position + 1)
+            position = text.find("\n", position + 1)
+        return starts
+
+    def _insert_chunks(self, pieces: List[str], index: int, on_done):
+        if index >= len(pieces):
+            self._pending = None
+            self.document = None
+            self.textbox.configure(state="normal")
+            self.on_progress(None)
+            if on_done:
+                on_done()
+            return
+        self.textbox.configure(state="normal")
+        self.textbox.insert("end", pieces[index])
+        self.textbox.configure(state="disabled")
+        self.on_progress((index + 1) / len(pieces))
+        self._pending = self.textbox.after_idle(self._insert_chunks, pieces, index + 1, on_done)
+
+    def _cancel_pending(self):
+        if self._pending is not None:
+            try:
+                self.textbox.after_cancel(self._pending)
+            except Exception:
+                pass
+            self._pending = None
+            self.on_progress(None)
@@ -0,0 +1,97 @@
+# line_diff.py
+# Line diff for large texts: patience-style anchoring on lines that occur once on each side, with
+# difflib only for the small gaps between anchors. Used by the diff view and the history store.
+
+import difflib
+from bisect import bisect_left
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+# Gaps without unique anchors are matched with difflib only up to this many line pairs
+# (len(a) * len(b)); larger ones are reported as a single replacement.
+MAX_GAP_WORK = 250_000
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def _unique_anchors(a: Sequence, alo: int, ahi: int, b: Sequence, blo: int, bhi: int) -> List[Tuple[int, int]]:
+    # Lines occurring exactly once in both ranges, as (i, j) pairs forming the longest increasing run
+    a_counts = Counter(a[alo:ahi])
+    b_counts = Counter(b[blo:bhi])
+    b_index = {b[j]: j for j in range(blo, bhi) if b_counts[b[j]] == 1}
+    pairs = [(i, b_index[a[i]]) for i in range(alo, ahi) if a_counts[a[i]] == 1 and a[i] in b_index]
+    if not pairs:
+        return []
+    # Patience sorting: longest increasing subsequence of the j's, in O(n log n)
+    tails, tail_ids, previous = [], [], [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_ids.append(k)
+        else:
+            tails[pos] = j
+            tail_ids[pos] = k
+        previous[k] = tail_ids[pos - 1] if pos else None
+    run = []
+    k = tail_ids[-1]
+    while k is not None:
+        run.append(pairs[k])
+        k = previous[k]
+    run.reverse()
+    return run
+
+
+def matching_lines(a: Sequence, b: Sequence) -> List[Tuple[int, int]]:
+    """Sorted (i, j) pairs of lines of a and b that the diff keeps as equal."""
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        # Common prefix and suffix
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            previous_i, previous_j = alo, blo
+            for i, j in anchors:
+                matches.append((i, j))
+                regions.append((previous_i, i, previous_j, j))
+                previous_i, previous_j = i + 1, j + 1
+            regions.append((previous_i, ahi, previous_j, bhi))
+        elif (ahi - alo) * (bhi - blo) <= MAX_GAP_WORK:
+            matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                matches.extend((alo + i + k, blo + j + k) for k in range(size))
+    matches.sort()
+    return matches
+
+
+def line_opcodes(a: Sequence, b: Sequence) -> List[Opcode]:
+    """difflib-style opcodes ("equal", "replace", "delete", "insert") turning a into b. Roughly linear
+    in the size of the inputs, unlike SequenceMatcher, which is quadratic on large rewrites."""
+    opcodes = []
+    i = j = 0
+    for mi, mj in matching_lines(a, b) + [(len(a), len(b))]:
+        if mi > i and mj > j:
+            opcodes.append(("replace", i, mi, j, mj))
+        elif mi > i:
+            opcodes.append(("delete", i, mi, j, j))
+        elif mj > j:
+            opcodes.append(("insert", i, i, j, mj))
+        if mi < len(a):
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][2] == mi:
+                tag, i1, _, j1, _ = opcodes.pop()
+                opcodes.append(("equal", i1, mi + 1, j1, mj + 1))
+            else:
+                opcodes.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
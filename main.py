@@ -1,16 +1,24 @@
 """
 Entry point for CodeAssistant - minimal wrapper that loads .env and runs the app
+
+`python main.py batch ...` runs the headless batch mode instead (see batch.py).
 """
 
+import sys
+
+# The only place .env is loaded for the app; everything else reads os.environ
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except Exception:
     pass
 
-from app import CodeAssistantApp
-
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+
+    from app import CodeAssistantApp
     app = CodeAssistantApp()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
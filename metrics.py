@@ -0,0 +1,132 @@
+# metrics.py
+# Lightweight request/job instrumentation: rolling in-memory spans plus an optional JSONL trace file.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+from config import data_dir, env_flag
+
+
+def estimate_tokens(chars: int) -> int:
+    # Roughly four characters per token for code and English text
+    return (chars + 3) // 4
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class LatencyTracker:  # Rolling window of recent latencies (seconds)
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples)
+        return percentile(samples, pct)
+
+
+class MetricsRecorder:
+    """Keeps the most recent spans for live summaries and appends every span to a JSONL trace.
+
+    A span is a flat dict with at least "kind" ("request" or "job"), "ts" (wall clock) and
+    "status"; latencies are in seconds.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, window: int = 1000):
+        self.trace_path = trace_path
+        self._spans = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._trace_file = None
+        if trace_path:
+            try:
+                self._trace_file = open(trace_path, "a", encoding="utf-8", buffering=1)
+            except OSError:
+                self._trace_file = None
+
+    def record(self, kind: str, **fields) -> dict:
+        span = {"kind": kind, "ts": round(time.time(), 3)}
+        span.update({k: round(v, 4) if isinstance(v, float) else v for k, v in fields.items()})
+        with self._lock:
+            self._spans.append(span)
+            if self._trace_file:
+                try:
+                    self._trace_file.write(json.dumps(span, separators=(",", ":")) + "\n")
+                except (OSError, ValueError):
+                    self._trace_file = None
+        return span
+
+    def spans(self, kind: Optional[str] = None, since: Optional[float] = None) -> List[dict]:
+        with self._lock:
+            spans = list(self._spans)
+        return [s for s in spans
+                if (kind is None or s["kind"] == kind) and (since is None or s["ts"] >= since)]
+
+    def summary(self, window_seconds: float = 300) -> dict:
+        """Rolling figures over the last window_seconds, for the metrics panel and tuning."""
+        since = time.time() - window_seconds
+        requests = self.spans("request", since)
+        jobs = self.spans("job", since)
+        live = [s for s in requests if not s.get("cached")]
+        ok = [s for s in live if s["status"] == "ok"]
+
+        def values(spans, key):
+            return [s[key] for s in spans if s.get(key) is not None]
+
+        first = min((s["ts"] for s in requests), default=None)
+        elapsed = max(1.0, time.time() - first) if first is not None else window_seconds
+        return {
+            "requests": len(requests),
+            "cache_hits": len(requests) - len(live),
+            "errors": len(live) - len(ok),
+            "latency_p50": percentile(values(ok, "total"), 50),
+            "latency_p95": percentile(values(ok, "total"), 95),
+            "ttfb_p50": percentile(values(ok, "ttfb"), 50),
+            "ttfb_p95": percentile(values(ok, "ttfb"), 95),
+            "queue_wait_p50": percentile(values(jobs, "queue_wait"), 50),
+            "queue_wait_p95": percentile(values(jobs, "queue_wait"), 95),
+            "requests_per_min": len(requests) * 60 / elapsed,
+            "prompt_tokens": sum(values(requests, "prompt_tokens")),
+            "response_tokens": sum(values(requests, "response_tokens")),
+            "jobs": len(jobs),
+        }
+
+    def model_latency(self, model: str, pct: float = 50, window_seconds: float = 1800) -> Optional[float]:
+        spans = [s for s in self.spans("request", time.time() - window_seconds)
+                 if s.get("model") == model and s["status"] == "ok" and not s.get("cached")]
+        return percentile([s["total"] for s in spans], pct)
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> MetricsRecorder:
+    """Process-wide recorder. Traces go to TRACE_FILE (default traces.jsonl in the data directory);
+    METRICS_TRACE=0 keeps metrics in memory only."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            path = None
+            if env_flag("METRICS_TRACE", True):
+                try:
+                    path = os.environ.get("TRACE_FILE") or os.path.join(data_dir(), "traces.jsonl")
+                except OSError:
+                    path = None
+            _recorder = MetricsRecorder(path)
+        return _recorder
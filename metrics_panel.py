@@ -0,0 +1,50 @@
+import customtkinter as ctk
+from theme import Theme
+
+
+class MetricsWindow(ctk.CTkToplevel):  # Small live view of rolling latency/throughput figures
+    REFRESH_MS = 1000
+    WINDOW_SECONDS = 300
+
+    ROWS = [
+        ("Requests (5 min)", "requests", "{:d}"),
+        ("Requests / min", "requests_per_min", "{:.1f}"),
+        ("Cache hits", "cache_hits", "{:d}"),
+        ("Errors", "errors", "{:d}"),
+        ("Latency p50", "latency_p50", "{:.2f} s"),
+        ("Latency p95", "latency_p95", "{:.2f} s"),
+        ("First chunk p50", "ttfb_p50", "{:.2f} s"),
+        ("First chunk p95", "ttfb_p95", "{:.2f} s"),
+        ("Queue wait p50", "queue_wait_p50", "{:.2f} s"),
+        ("Queue wait p95", "queue_wait_p95", "{:.2f} s"),
+        ("Prompt tokens (est.)", "prompt_tokens", "{:,d}"),
+        ("Response tokens (est.)", "response_tokens", "{:,d}"),
+    ]
+
+    def __init__(self, parent, recorder):
+        super().__init__(parent, fg_color=Theme.FRAME_BG)
+        self.title("Metrics")
+        self.geometry("320x400")
+        self.recorder = recorder
+        self.grid_columnconfigure(1, weight=1)
+
+        self.value_labels = {}
+        for i, (title, key, _fmt) in enumerate(self.ROWS):
+            ctk.CTkLabel(self, text=title, font=("Consolas", 11), text_color=Theme.TEXT, anchor="w").grid(
+                row=i, column=0, padx=(15, 10), pady=2, sticky="w")
+            value = ctk.CTkLabel(self, text="-", font=("Consolas", 11, "bold"), text_color=Theme.BLUE, anchor="e")
+            value.grid(row=i, column=1, padx=(0, 15), pady=2, sticky="e")
+            self.value_labels[key] = value
+
+        trace = recorder.trace_path or "disabled"
+        ctk.CTkLabel(self, text=f"Trace: {trace}", font=("Consolas", 9), text_color="#6c7a89",
+                     wraplength=290, justify="left").grid(row=len(self.ROWS), column=0, columnspan=2,
+                                                          padx=15, pady=(10, 10), sticky="w")
+        self._refresh()
+
+    def _refresh(self):
+        summary = self.recorder.summary(self.WINDOW_SECONDS)
+        for _title, key, fmt in self.ROWS:
+            value = summary.get(key)
+            self.value_labels[key].configure(text="-" if value is None else fmt.format(value))
+        self.after(self.REFRESH_MS, self._refresh)
@@ -0,0 +1,162 @@
+# mock_backend.py
+# Offline stand-in for the Gemini model, for benchmarks and local testing without a key or network.
+
+import datetime
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from api_client import GeminiAPIClient
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # pragma: no cover - api_core ships with google-generativeai
+    google_exceptions = None
+
+# Prompt markers after which the builders in api_client place the code
+_CODE_MARKERS = ("Code Snippet:", "Previous Output:", "Current Code:")
+# Persona prompts put the task after the code
+_TASK_RE = re.compile(r"\n\s*Task: Your task is")
+
+
+class MockGeminiModel:
+    """Mimics genai.GenerativeModel.generate_content, including stream=True.
+
+    latency is the time to first chunk, chars_per_second the streaming rate, error_rate the chance
+    that a call fails with a retryable 503/429, and output_chars a fixed response size (by default
+    the code from the prompt is echoed back with a comment added). prefill_chars_per_second adds
+    time to first chunk in proportion to the prompt sent, so context caching shows up in latency.
+    """
+
+    def __init__(self, latency: float = 0.2, chars_per_second: float = 4000, chunk_chars: int = 80,
+                 error_rate: float = 0.0, output_chars: Optional[int] = None, seed: Optional[int] = None,
+                 prefill_chars_per_second: Optional[float] = None):
+        self.latency = latency
+        self.prefill_chars_per_second = prefill_chars_per_second
+        self.chars_per_second = chars_per_second
+        self.chunk_chars = max(1, chunk_chars)
+        self.error_rate = error_rate
+        self.output_chars = output_chars
+        self.calls = 0
+        self.errors = 0
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False, request_options=None, context: str = "",
+                         **kwargs):
+        # context is a prefix held by a MockContextBackend cache: answered from, but not sent
+        latency = self.latency
+        if self.prefill_chars_per_second:
+            latency += len(prompt) / self.prefill_chars_per_second
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if fail:
+            time.sleep(latency)
+            raise self._error()
+
+        text = self.respond(context + prompt)
+        with self._lock:
+            self.response_chars += len(text)
+        if not stream:
+            time.sleep(latency + len(text) / self.chars_per_second)
+            return SimpleNamespace(text=text)
+        return self._stream(text, latency)
+
+    def respond(self, prompt: str) -> str:
+        code = _extract_code(prompt)
+        if "<<<<<<< SEARCH" in prompt:
+            # Edit-based refinement: touch the first non-empty line
+            first = next((line for line in code.splitlines() if line.strip()), "")
+            return f"<<<<<<< SEARCH\n{first}\n=======\n# refined\n{first}\n>>>>>>> REPLACE\n"
+        if self.output_chars is not None:
+            line = "value = compute(value)  # mock output\n"
+            return (line * (self.output_chars // len(line) + 1))[:self.output_chars]
+        return "# processed by mock backend\n" + code
+
+    def _stream(self, text: str, latency: float):
+        time.sleep(latency)
+        delay = self.chunk_chars / self.chars_per_second
+        for start in range(0, len(text), self.chunk_chars):
+            if start:
+                time.sleep(delay)
+            yield SimpleNamespace(text=text[start:start + self.chunk_chars])
+
+    def _error(self) -> Exception:
+        if google_exceptions is None:
+            return ConnectionError("mock backend: connection reset")
+        if self._random.random() < 0.5:
+            return google_exceptions.ResourceExhausted("mock backend: quota exceeded. Please retry in 0.1s")
+        return google_exceptions.ServiceUnavailable("mock backend: service unavailable")
+
+
+def _extract_code(prompt: str) -> str:
+    for marker in _CODE_MARKERS:
+        index = prompt.rfind(marker)
+        if index != -1:
+            code = prompt[index + len(marker):]
+            task = _TASK_RE.search(code)
+            if task:
+                code = code[:task.start()]
+            return re.sub(r"\s+$", "", code.lstrip()) + "\n"
+    return prompt
+
+
+class MockContextBackend:  # Stand-in for server-side context caching, for ContextCache
+    def __init__(self, models: Callable[[str], MockGeminiModel]):
+        self.models = models
+        self.created = 0
+        self.deleted = 0
+        self.uploaded_chars = 0
+
+    def create(self, model_name: str, text: str, ttl):
+        # Same TTL types as google.generativeai's caching_types.to_optional_ttl
+        if not isinstance(ttl, (int, datetime.timedelta, dict)):
+            raise TypeError(f"Could not convert input to `ttl`: {type(ttl)}")
+        self.created += 1
+        self.uploaded_chars += len(text)
+        return SimpleNamespace(name=f"cachedContents/mock-{self.created}", model_name=model_name, text=text)
+
+    def model(self, handle):
+        base = self.models(handle.model_name)
+        return SimpleNamespace(generate_content=lambda prompt, **kwargs: base.generate_content(
+            prompt, context=handle.text, **kwargs))
+
+    def delete(self, handle):
+        self.deleted += 1
+
+
+def make_mock_client(models: Optional[dict] = None, **model_options) -> GeminiAPIClient:
+    """A GeminiAPIClient wired to MockGeminiModel, with the response cache disabled and context
+    caching (when enabled) served by a MockContextBackend.
+
+    models maps extra model names (for routing and fan-out) to their own MockGeminiModel options;
+    any other name gets a model built from model_options.
+    """
+    client = GeminiAPIClient()
+    client.model = MockGeminiModel(**model_options)
+    client.model_name = "mock"
+    extra = {}
+    lock = threading.Lock()
+
+    def factory(name):
+        with lock:
+            if name not in extra:
+                extra[name] = MockGeminiModel(**(models or {}).get(name, model_options))
+            return extra[name]
+
+    client.model_factory = factory
+    if client.context_cache:
+        client.context_cache.backend = MockContextBackend(
+            lambda name: client.model if name == client.model_name else factory(name))
+    client.cache = None
+    client.backoff_base = 0.05
+    return client
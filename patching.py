@@ -0,0 +1,133 @@
+# patching.py
+# Applies model-produced edits (SEARCH/REPLACE blocks or unified diffs) to the previous output locally.
+
+import re
+from typing import List, Optional, Tuple
+
+NO_CHANGES = "NO CHANGES"
+
+_BLOCK_RE = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$",
+    re.MULTILINE | re.DOTALL,
+)
+_HUNK_RE = re.compile(r"^@@ .* @@")
+_FENCE_LINE_RE = re.compile(r"^[ \t]*```", re.MULTILINE)
+
+
+class PatchError(Exception):
+    pass
+
+
+def apply_model_edits(source: str, response: str) -> str:
+    """Apply the edits in response to source; raises PatchError if they can't be applied cleanly."""
+    response = strip_fences(response)
+    if response.strip() == NO_CHANGES:
+        return source
+    blocks = parse_edit_blocks(response)
+    if blocks:
+        return apply_edit_blocks(source, blocks)
+    if any(_HUNK_RE.match(line) for line in response.splitlines()):
+        return apply_unified_diff(source, response)
+    raise PatchError("Response contains no edit blocks or diff hunks.")
+
+
+def parse_edit_blocks(text: str) -> List[Tuple[str, str]]:
+    return [(m.group(1), m.group(2)) for m in _BLOCK_RE.finditer(text)]
+
+
+def apply_edit_blocks(source: str, blocks: List[Tuple[str, str]]) -> str:
+    text = source
+    for search, replace in blocks:
+        if not search.strip():
+            raise PatchError("Edit block has an empty SEARCH section.")
+        if text.count(search) == 1:
+            text = text.replace(search, replace, 1)
+            continue
+        # Models often drop trailing whitespace or the final newline; retry line by line
+        text = _replace_lines(text, search.splitlines(), replace.splitlines())
+    return text
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    lines = source.splitlines()
+    for old, new in _parse_hunks(diff):
+        lines = _replace_sequence(lines, old, new)
+    result = "\n".join(lines)
+    return result + "\n" if source.endswith("\n") else result
+
+
+def _parse_hunks(diff: str) -> List[Tuple[List[str], List[str]]]:
+    hunks = []
+    old, new = None, None
+    for line in diff.splitlines():
+        if _HUNK_RE.match(line):
+            if old is not None:
+                hunks.append((old, new))
+            old, new = [], []
+        elif old is None or line.startswith(("--- ", "+++ ")):
+            continue
+        elif line.startswith("-"):
+            old.append(line[1:])
+        elif line.startswith("+"):
+            new.append(line[1:])
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        else:
+            context = line[1:] if line.startswith(" ") else line
+            old.append(context)
+            new.append(context)
+    if old is not None:
+        hunks.append((old, new))
+    if not hunks:
+        raise PatchError("Diff contains no hunks.")
+    return hunks
+
+
+def _replace_lines(text: str, old: List[str], new: List[str]) -> str:
+    lines = _replace_sequence(text.splitlines(), old, new)
+    result = "\n".join(lines)
+    return result + "\n" if text.endswith("\n") else result
+
+
+def _replace_sequence(lines: List[str], old: List[str], new: List[str]) -> List[str]:
+    start = _find_unique(lines, old)
+    if start is None:
+        raise PatchError("Could not locate the edited lines:\n" + "\n".join(old[:5]))
+    return lines[:start] + new + lines[start + len(old):]
+
+
+def _find_unique(lines: List[str], old: List[str]) -> Optional[int]:
+    if not old:
+        return None
+    # Exact match first, then ignoring trailing whitespace; either must be unambiguous
+    for normalize in (lambda s: s, str.rstrip):
+        target = [normalize(line) for line in old]
+        matches = [i for i in range(len(lines) - len(old) + 1)
+                   if normalize(lines[i]) == target[0]
+                   and [normalize(line) for line in lines[i:i + len(old)]] == target]
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            raise PatchError("Edited lines match more than one location:\n" + "\n".join(old[:5]))
+    return None
+
+
+def has_fence_lines(text: str) -> bool:
+    return bool(_FENCE_LINE_RE.search(text))
+
+
+def strip_fences(text: str, source: str = "") -> str:
+    """Remove a markdown fence wrapped around the whole response.
+
+    Anything else is returned unchanged: responses with further fence lines (prose around a code
+    block, several blocks) and responses to a source that contains fence lines itself, e.g. Markdown.
+    """
+    if has_fence_lines(source):
+        return text
+    stripped = text.strip()
+    if not (stripped.startswith("```") and stripped.endswith("```")):
+        return text
+    if len(_FENCE_LINE_RE.findall(stripped)) != 2:
+        return text
+    body = stripped[3:-3]
+    return body.split("\n", 1)[1] if "\n" in body else ""
@@ -0,0 +1,402 @@
+# project_index.py
+# Local index of a Python project's definitions, imports and call sites, kept in SQLite and updated
+# by file mtime on a background thread. Prompts use it to include only the definitions a snippet uses.
+
+import ast
+import builtins
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from chunker import PYTHON_EXTENSIONS
+from config import data_dir, env_float, env_int
+
+ROOT_MARKERS = (".git", ".hg", "pyproject.toml", "setup.py", "setup.cfg")
+SKIP_DIRS = {"__pycache__", "node_modules", "venv", "env", "site-packages", "build", "dist"}
+# Definitions longer than this are indexed as their signature and docstring only
+MAX_SYMBOL_CHARS = 2000
+# Same estimate as metrics.estimate_tokens
+CHARS_PER_TOKEN = 4
+_BUILTINS = set(dir(builtins))
+
+
+class Symbol(NamedTuple):
+    name: str
+    kind: str
+    lineno: int
+    text: str
+
+
+class Reference(NamedTuple):
+    module: str  # dotted module name of a "from x import y", "" otherwise
+    name: str
+
+
+def find_project_root(path: str) -> str:
+    """The nearest directory above path holding a VCS directory or packaging file, else its own directory."""
+    start = os.path.dirname(os.path.abspath(path))
+    directory = start
+    while True:
+        if any(os.path.exists(os.path.join(directory, marker)) for marker in ROOT_MARKERS):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return start
+        directory = parent
+
+
+def _signature(lines: List[str], node) -> str:
+    # Decorators and the def/class line(s), plus the docstring when there is one
+    first = min([d.lineno for d in node.decorator_list] + [node.lineno])
+    body = node.body[0]
+    end = body.end_lineno if _is_docstring(body) else body.lineno - 1
+    return "".join(lines[first - 1:max(end, node.lineno)])
+
+
+def _is_docstring(node) -> bool:
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def _definition_text(lines: List[str], node) -> str:
+    if isinstance(node, ast.ClassDef):
+        # Classes are summarised: header, docstring and method signatures
+        parts = [_signature(lines, node)]
+        for item in node.body:
+            if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                parts.append(_signature(lines, item).rstrip("\n") + " ...\n")
+        return "".join(parts)
+    first = min([d.lineno for d in node.decorator_list] + [node.lineno])
+    text = "".join(lines[first - 1:node.end_lineno])
+    if len(text) > MAX_SYMBOL_CHARS:
+        text = _signature(lines, node).rstrip("\n") + " ...\n"
+    return text
+
+
+def _call_name(node: ast.Call) -> Optional[str]:
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+def index_source(source: str):
+    """(symbols, imports, calls) of a module: top-level functions and classes (methods are part of
+    their class's summary); imported (module, name) pairs; and (caller, callee, line) for every call.
+    Raises SyntaxError/ValueError."""
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    symbols, imports, calls = [], [], []
+
+    def visit_calls(node, caller):
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call):
+                callee = _call_name(child)
+                if callee:
+                    calls.append((caller, callee, child.lineno))
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(Symbol(node.name, "function", node.lineno, _definition_text(lines, node)))
+            visit_calls(node, node.name)
+        elif isinstance(node, ast.ClassDef):
+            symbols.append(Symbol(node.name, "class", node.lineno, _definition_text(lines, node)))
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    visit_calls(item, f"{node.name}.{item.name}")
+        else:
+            if isinstance(node, ast.Import):
+                imports.extend(("", alias.name) for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                imports.extend((node.module or "", alias.name) for alias in node.names)
+            visit_calls(node, "<module>")
+    return symbols, imports, calls
+
+
+def snippet_references(code: str) -> Tuple[List[str], Dict[str, Reference], set]:
+    """Names a snippet uses but doesn't define, most relevant first (calls, then other names); the
+    imports that bind them; and the names the snippet defines itself.
+
+    Attributes only count as mod.attr where mod is bound by an import in the snippet (reported as
+    imported["mod.attr"]); a bare attribute like self.cache.get says nothing about which get it is.
+    """
+    tree = ast.parse(code)
+    defined, imported, modules = set(), {}, {}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(node.name)
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                local = alias.asname or alias.name.split(".")[0]
+                imported[local] = Reference("", alias.name)
+                # "import a.b" binds a, "import a.b as c" binds a.b
+                modules[local] = alias.name if alias.asname else local
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                imported[alias.asname or alias.name] = Reference(node.module or "", alias.name)
+                modules[alias.asname or alias.name] = ".".join(filter(None, (node.module, alias.name)))
+
+    def module_attribute(node) -> Optional[str]:
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id in modules:
+            imported[f"{node.value.id}.{node.attr}"] = Reference(modules[node.value.id], node.attr)
+            return node.attr
+        return None
+
+    calls, names = [], []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            name = node.func.id if isinstance(node.func, ast.Name) else module_attribute(node.func)
+            if name:
+                calls.append(name)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            names.append(node.id)
+        else:
+            name = module_attribute(node)
+            if name:
+                names.append(name)
+    ordered = []
+    for name in calls + names:
+        name = imported[name].name if name in imported and imported[name].module else name
+        if name not in defined and name not in _BUILTINS and name not in ordered:
+            ordered.append(name)
+    return ordered, imported, defined
+
+
+class ProjectIndex:
+    """Index of the Python files under root, stored in an SQLite file at path.
+
+    refresh() re-parses only files whose mtime or size changed and drops deleted ones;
+    refresh_async() runs it on a daemon thread unless one is already running or the last refresh is
+    younger than max_age. context_for() answers from whatever has been indexed so far.
+    """
+
+    def __init__(self, root: str, path: str, max_files: int = 5000):
+        self.root = os.path.abspath(root)
+        self.path = path
+        self.max_files = max_files
+        self.last_refresh = None
+        self.files_indexed = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS symbols (path TEXT NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,"
+            " lineno INTEGER NOT NULL, text TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS imports (path TEXT NOT NULL, module TEXT NOT NULL, name TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS calls (path TEXT NOT NULL, caller TEXT NOT NULL, callee TEXT NOT NULL,"
+            " lineno INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);"
+            "CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);"
+            "CREATE INDEX IF NOT EXISTS imports_path ON imports (path);"
+            "CREATE INDEX IF NOT EXISTS calls_callee ON calls (callee);"
+            "CREATE INDEX IF NOT EXISTS calls_path ON calls (path);"
+        )
+        self._conn.commit()
+
+    def _python_files(self):
+        count = 0
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d not in SKIP_DIRS)
+            for name in sorted(files):
+                if name.endswith(PYTHON_EXTENSIONS):
+                    yield os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+                    count += 1
+                    if count >= self.max_files:
+                        return
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the files on disk; returns the number of files re-parsed."""
+        with self._lock:
+            known = dict(((path, (mtime, size)) for path, mtime, size in
+                          self._conn.execute("SELECT path, mtime, size FROM files")))
+        seen = set()
+        parsed = 0
+        for rel_path in self._python_files():
+            seen.add(rel_path)
+            try:
+                stat = os.stat(os.path.join(self.root, rel_path))
+            except OSError:
+                continue
+            if known.get(rel_path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                with open(os.path.join(self.root, rel_path), "r", encoding="utf-8", errors="replace") as file:
+                    entries = index_source(file.read())
+            except (OSError, SyntaxError, ValueError, RecursionError):
+                # Recorded with no entries, so the file isn't re-read until it changes
+                entries = [], [], []
+            self._store(rel_path, stat.st_mtime_ns, stat.st_size, entries)
+            parsed += 1
+        with self._lock:
+            for rel_path in set(known) - seen:
+                self._delete(rel_path)
+            self._conn.commit()
+            self.files_indexed = len(seen)
+            self.last_refresh = time.monotonic()
+        return parsed
+
+    def refresh_async(self, max_age: float = 0):
+        with self._lock:
+            if self._refreshing:
+                return
+            if self.last_refresh is not None and time.monotonic() - self.last_refresh < max_age:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_worker, name="project-index", daemon=True).start()
+
+    def _refresh_worker(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _store(self, rel_path: str, mtime: int, size: int, entries):
+        symbols, imports, calls = entries
+        with self._lock:
+            self._delete(rel_path)
+            self._conn.execute("INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)", (rel_path, mtime, size))
+            self._conn.executemany(
+                "INSERT INTO symbols (path, name, kind, lineno, text) VALUES (?, ?, ?, ?, ?)",
+                [(rel_path,) + tuple(symbol) for symbol in symbols],
+            )
+            self._conn.executemany("INSERT INTO imports (path, module, name) VALUES (?, ?, ?)",
+                                   [(rel_path,) + entry for entry in imports])
+            self._conn.executemany("INSERT INTO calls (path, caller, callee, lineno) VALUES (?, ?, ?, ?)",
+                                   [(rel_path,) + entry for entry in calls])
+            self._conn.commit()
+
+    def _delete(self, rel_path: str):
+        for table in ("files", "symbols", "imports", "calls"):
+            self._conn.execute(f"DELETE FROM {table} WHERE path = ?", (rel_path,))
+
+    def _relative(self, filename: Optional[str]) -> Optional[str]:
+        if not filename:
+            return None
+        return os.path.relpath(os.path.abspath(filename), self.root).replace(os.sep, "/")
+
+    def context_for(self, code: str, filename: Optional[str] = None, budget_tokens: int = 1500) -> str:
+        """Definitions from elsewhere in the project that code uses, then call sites of the functions
+        it defines, as much as fits in budget_tokens. Empty when code isn't Python or nothing matches."""
+        try:
+            names, imported, defined = snippet_references(code)
+        except (SyntaxError, ValueError, RecursionError):
+            return ""
+        own_path = self._relative(filename)
+        budget = budget_tokens * CHARS_PER_TOKEN  # remaining characters
+        sections = []
+        with self._lock:
+            for name in names:
+                rows = self._conn.execute(
+                    "SELECT path, lineno, text FROM symbols WHERE name = ? ORDER BY path",
+                    (name,),
+                ).fetchall()
+                rows = self._rank(rows, imported, name, own_path)
+                for path, lineno, text in rows:
+                    section = f"# {path}, line {lineno}\n{text.rstrip()}\n"
+                    if len(section) <= budget:
+                        sections.append(section)
+                        budget -= len(section)
+            # Call sites only count in files that import the snippet's module, so a common name
+            # defined here doesn't pull in every unrelated call of it
+            module = os.path.splitext(os.path.basename(own_path))[0] if own_path else None
+            call_sites = []
+            for name in sorted(defined) if module else []:
+                for path, caller, lineno in self._conn.execute(
+                        "SELECT c.path, c.caller, c.lineno FROM calls c WHERE c.callee = ? AND c.path != ?"
+                        " AND EXISTS (SELECT 1 FROM imports i WHERE i.path = c.path AND"
+                        " (i.module = ? OR i.module LIKE ? OR i.name = ? OR i.name LIKE ?))"
+                        " ORDER BY c.path, c.lineno LIMIT 5",
+                        (name, own_path, module, "%." + module, module, "%." + module)):
+                    line = f"{path}:{lineno} ({caller}) calls {name}\n"
+                    if len(line) <= budget:
+                        call_sites.append(line)
+                        budget -= len(line)
+        if call_sites:
+            sections.append("# Call sites elsewhere in the project\n" + "".join(call_sites))
+        return "\n".join(sections)
+
+    @staticmethod
+    def _rank(rows, imported: Dict[str, Reference], name: str, own_path: Optional[str]):
+        # Definitions in the snippet's own file are assumed to be in the snippet already
+        rows = [row for row in rows if row[0] != own_path]
+        modules = {ref.module for ref in imported.values() if ref.name == name and ref.module}
+        if modules:
+            # An import names the module: only a file matching it can hold the definition
+            return [row for row in rows if any(_module_matches(row[0], module) for module in modules)][:1]
+        return rows[:2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            symbols = self._conn.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+        return {"files": self.files_indexed, "symbols": symbols}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _module_matches(rel_path: str, module: str) -> bool:
+    stem = rel_path.rsplit(".", 1)[0]
+    dotted = stem[:-len("/__init__")] if stem.endswith("/__init__") else stem
+    dotted = dotted.replace("/", ".")
+    return dotted == module or dotted.endswith("." + module)
+
+
+class ProjectIndexes:  # One ProjectIndex per project root, opened when a file from it is loaded
+    def __init__(self, directory: Optional[str] = None, max_files: int = 5000, refresh_interval: float = 30):
+        self.directory = directory
+        self.max_files = max_files
+        self.refresh_interval = refresh_interval
+        self._indexes = {}
+        self._roots = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ProjectIndexes":
+        return cls(max_files=env_int("PROJECT_INDEX_MAX_FILES", 5000),
+                   refresh_interval=env_float("PROJECT_INDEX_REFRESH_SECONDS", 30))
+
+    def _root(self, filename: str) -> str:
+        directory = os.path.dirname(os.path.abspath(filename))
+        root = self._roots.get(directory)
+        if root is None:
+            root = self._roots[directory] = find_project_root(filename)
+        return root
+
+    def open(self, filename: str) -> Optional[ProjectIndex]:
+        """Open (or reuse) the index of filename's project and start bringing it up to date."""
+        if not filename or not filename.endswith(PYTHON_EXTENSIONS):
+            return None
+        with self._lock:
+            root = self._root(filename)
+            index = self._indexes.get(root)
+            if index is None:
+                try:
+                    directory = self.directory or os.path.join(data_dir(), "project_index")
+                    os.makedirs(directory, exist_ok=True)
+                    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+                    index = ProjectIndex(root, os.path.join(directory, f"{digest}.sqlite3"), self.max_files)
+                except (OSError, sqlite3.Error):
+                    return None
+                self._indexes[root] = index
+        index.refresh_async()
+        return index
+
+    def context_for(self, code: str, filename: Optional[str], budget_tokens: int) -> str:
+        """Project context for code from filename, from an index opened earlier; "" if there is none.
+        A refresh is started in the background when the index is older than refresh_interval."""
+        if not filename or budget_tokens <= 0:
+            return ""
+        with self._lock:
+            index = self._indexes.get(self._root(filename))
+        if index is None:
+            return ""
+        index.refresh_async(self.refresh_interval)
+        return index.context_for(code, filename, budget_tokens)
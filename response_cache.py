@@ -0,0 +1,144 @@
+# response_cache.py
+# Persistent, content-addressed cache of model responses backed by SQLite.
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class ResponseCache:  # On-disk LRU cache keyed by hash(model name, prompt)
+    """Best effort: an SQLite error (e.g. "database is locked" while another process writes, or a
+    full disk) is counted in errors and treated as a miss or a skipped store, never raised."""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._total_bytes = row[0]
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        digest.update((model_name or "").encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            total = self._total_bytes
+            try:
+                return self._get(key)
+            except sqlite3.Error:
+                self._failed(total)
+                self.misses += 1
+                return None
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value, size, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        value, size, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            self._total_bytes -= size
+            self.misses += 1
+            return None
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            total = self._total_bytes
+            try:
+                self._put(key, value, size, expires_at, now)
+            except sqlite3.Error:
+                self._failed(total)
+
+    def _put(self, key: str, value: str, size: int, expires_at: Optional[float], now: float):
+        old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if old is not None:
+            self._total_bytes -= old[0]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, value, size, expires_at, now),
+        )
+        self._total_bytes += size
+        self._evict()
+        self._conn.commit()
+
+    def _failed(self, total: int):
+        # Called with the lock held: undo the partial transaction, and the size total with it
+        self.errors += 1
+        self._total_bytes = total
+        try:
+            self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self):
+        # Drop expired entries first, then least recently used ones until under the size cap
+        if self._total_bytes <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
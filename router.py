@@ -0,0 +1,100 @@
+# router.py
+# Picks a model per request from configurable rules on action text and input size, preferring
+# whichever candidate model has been fastest recently.
+
+import json
+import os
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from metrics import MetricsRecorder
+
+
+class Route(NamedTuple):
+    models: Tuple[str, ...]
+    actions: Tuple[str, ...] = ()  # case-insensitive substrings of the action; empty matches any
+    min_lines: int = 0
+    max_lines: Optional[int] = None
+    max_latency: Optional[float] = None  # skip the route while its best model's p50 is above this
+
+    def matches(self, action: str, lines: int) -> bool:
+        if lines < self.min_lines or (self.max_lines is not None and lines > self.max_lines):
+            return False
+        action = action.lower()
+        return not self.actions or any(keyword in action for keyword in self.actions)
+
+
+def parse_routes(spec: str) -> List[Route]:
+    """Routes from a JSON list (or a path to a JSON file), e.g.
+
+    [{"models": ["gemini-1.5-flash"], "actions": ["concise", "comment"], "max_lines": 200},
+     {"models": ["gemini-1.5-pro"], "actions": ["refactor", "optimize"]}]
+
+    "model" may be given instead of "models" for a single candidate.
+    """
+    if os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as file:
+            spec = file.read()
+    routes = []
+    for item in json.loads(spec):
+        models = item.get("models") or [item["model"]]
+        routes.append(Route(
+            models=tuple(models),
+            actions=tuple(keyword.lower() for keyword in item.get("actions", ())),
+            min_lines=int(item.get("min_lines", 0)),
+            max_lines=item.get("max_lines"),
+            max_latency=item.get("max_latency"),
+        ))
+    return routes
+
+
+class ModelRouter:
+    """First matching route wins; otherwise the default model is used.
+
+    Within a route, a model with no recent samples is tried first, then the one with the lowest
+    recent p50 latency, so a slow or degraded model loses traffic until it recovers.
+    """
+
+    def __init__(self, default_model: str, routes: Sequence[Route] = (),
+                 metrics: Optional[MetricsRecorder] = None, window_seconds: float = 1800):
+        self.default_model = default_model
+        self.routes = list(routes)
+        self.metrics = metrics
+        self.window_seconds = window_seconds
+
+    @classmethod
+    def from_env(cls, default_model: str, metrics: Optional[MetricsRecorder] = None) -> "ModelRouter":
+        # MODEL_ROUTES holds the JSON rules or a path to them; invalid rules disable routing
+        spec = os.environ.get("MODEL_ROUTES", "").strip()
+        routes = []
+        if spec:
+            try:
+                routes = parse_routes(spec)
+            except (OSError, ValueError, KeyError, TypeError):
+                routes = []
+        return cls(default_model, routes, metrics)
+
+    def choose(self, action: str, code: str) -> str:
+        lines = code.count("\n") + 1
+        for route in self.routes:
+            if not route.matches(action, lines):
+                continue
+            model, latency = self._fastest(route.models)
+            if route.max_latency is not None and latency is not None and latency > route.max_latency:
+                continue
+            return model
+        return self.default_model
+
+    def _fastest(self, models: Sequence[str]) -> Tuple[str, Optional[float]]:
+        if self.metrics is None or len(models) == 1:
+            return models[0], self._latency(models[0])
+        measured = [(self._latency(model), model) for model in models]
+        for latency, model in measured:
+            if latency is None:
+                return model, None
+        latency, model = min(measured)
+        return model, latency
+
+    def _latency(self, model: str) -> Optional[float]:
+        if self.metrics is None:
+            return None
+        return self.metrics.model_latency(model, 50, self.window_seconds)
@@ -0,0 +1,198 @@
+# scheduler.py
+# Central job scheduler: bounded worker pool, per-job timeouts and cancellation.
+
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed out"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+class Job:
+    """A unit of work. fn(job) runs on a worker thread and should poll job.cancelled while it waits."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label: str, fn: Callable[["Job"], object], timeout: Optional[float]):
+        self.id = next(Job._ids)
+        self.label = label
+        self.fn = fn
+        self.timeout = timeout
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.on_done = None
+        self._worker = None
+        self._dependents = []
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done_event.wait(timeout)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.label!r} {self.state}>"
+
+
+class JobScheduler:
+    def __init__(self, max_workers: int = 2, default_timeout: Optional[float] = 120,
+                 on_change: Optional[Callable[[], None]] = None, metrics=None):
+        self.default_timeout = default_timeout
+        self.on_change = on_change
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._jobs = []
+        # Daemon workers (rather than a ThreadPoolExecutor) so a stuck request never blocks app exit
+        self._queue = queue.Queue()
+        self._workers = []
+        # Workers still inside the fn of a job that timed out or was cancelled; they exit once it returns
+        self._retiring = set()
+        self._worker_ids = itertools.count()
+        for _ in range(max(1, max_workers)):
+            self._start_worker()
+
+    def _start_worker(self):
+        worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{next(self._worker_ids)}", daemon=True)
+        self._workers.append(worker)
+        worker.start()
+
+    def submit(self, label: str, fn: Callable[[Job], object],
+               on_done: Optional[Callable[[Job], None]] = None, timeout: Optional[float] = None,
+               after: Optional[Job] = None) -> Job:
+        """Queue fn; on_done(job) is called exactly once, from a worker or timer thread.
+
+        With after, the job stays queued without taking a worker until that job has finished (in
+        any state; fn checks how it ended), and its timeout only starts once it runs.
+        """
+        job = Job(label, fn, self.default_timeout if timeout is None else timeout)
+        job.on_done = on_done
+        with self._lock:
+            self._jobs.append(job)
+            waiting = after is not None and not after.finished
+            if waiting:
+                after._dependents.append(job)
+        if not waiting:
+            self._queue.put(job)
+        self._changed()
+        return job
+
+    def cancel(self, job: Job):
+        job._cancel_event.set()
+        self._finish(job, CANCELLED)
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            self.cancel(job)
+
+    def active_jobs(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs if not job.finished]
+
+    def shutdown(self):
+        self.cancel_all()
+        with self._lock:
+            workers = len(self._workers)
+        for _ in range(workers):
+            self._queue.put(None)
+
+    def _worker_loop(self):
+        current = threading.current_thread()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._run(job)
+            with self._lock:
+                if current in self._retiring:
+                    self._retiring.discard(current)
+                    return
+
+    def _run(self, job: Job):
+        with self._lock:
+            if job.finished:
+                return
+            job.state = RUNNING
+            job.started_at = time.monotonic()
+            job._worker = threading.current_thread()
+        self._changed()
+
+        timer = None
+        if job.timeout:
+            timer = threading.Timer(job.timeout, self._on_timeout, args=(job,))
+            timer.daemon = True
+            timer.start()
+        try:
+            result = job.fn(job)
+        except Exception as e:
+            self._finish(job, FAILED, error=e)
+        else:
+            self._finish(job, DONE, result=result)
+        finally:
+            if timer:
+                timer.cancel()
+
+    def _on_timeout(self, job: Job):
+        # The underlying call can't be interrupted; the job is marked finished, its worker replaced (see
+        # _finish) and its late result dropped
+        job._cancel_event.set()
+        self._finish(job, TIMED_OUT, error=TimeoutError(f"Request timed out after {job.timeout:g} seconds"))
+
+    def _finish(self, job: Job, state: str, result=None, error: Exception = None):
+        with self._lock:
+            if job.finished:
+                return
+            # A job cancelled while running still returns from fn; treat that as cancelled
+            if state == DONE and job.cancelled:
+                state = CANCELLED
+            worker = job._worker
+            if worker is not None and worker is not threading.current_thread() and worker.is_alive():
+                # Finished from outside (timeout, cancel) while fn still blocks its worker: hand the slot
+                # to a fresh worker so queued jobs don't wait for the stuck call to return
+                self._workers.remove(worker)
+                self._retiring.add(worker)
+                self._start_worker()
+            job.state = state
+            job.result = result if state == DONE else None
+            job.error = error
+            job.finished_at = time.monotonic()
+            self._jobs.remove(job)
+            dependents, job._dependents = job._dependents, []
+        job._done_event.set()
+        for dependent in dependents:
+            self._queue.put(dependent)
+        if self.metrics:
+            self.metrics.record(
+                "job",
+                label=job.label,
+                status=state,
+                queue_wait=(job.started_at or job.finished_at) - job.submitted_at,
+                total=job.finished_at - job.submitted_at,
+                run=job.finished_at - job.started_at if job.started_at else None,
+            )
+        if job.on_done:
+            job.on_done(job)
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
@@ -1,12 +1,14 @@
 import customtkinter as ctk
 from theme import Theme
+from config import env_flag, env_list
+from job_queue import JobQueueView
 
 
 class Sidebar(ctk.CTkFrame):
     def __init__(self, parent, callbacks: dict):
         super().__init__(parent, width=200, corner_radius=0, fg_color=Theme.FRAME_BG)
         self.callbacks = callbacks
-        self.grid_rowconfigure(10, weight=1)
+        self.grid_rowconfigure(14, weight=1)
 
         self._create_widgets()
 
@@ -36,9 +38,14 @@ class Sidebar(ctk.CTkFrame):
                                                   fg_color=Theme.YELLOW, hover_color=Theme.YELLOW_HOVER)
         self.generate_docs_button.grid(row=4, column=0, padx=20, pady=10)
 
+        # Only offered when FANOUT_MODELS names the models to race
+        self.fan_out_switch = ctk.CTkSwitch(self, text="Fan out to models", progress_color=Theme.BLUE)
+        if env_list("FANOUT_MODELS"):
+            self.fan_out_switch.grid(row=5, column=0, padx=20, pady=(0, 10), sticky="w")
+
         self.refine_label = ctk.CTkLabel(self, text="Refine Output",
                                          font=ctk.CTkFont(size=14, weight="bold"))
-        self.refine_label.grid(row=5, column=0, padx=20, pady=(20, 5))
+        self.refine_label.grid(row=6, column=0, padx=20, pady=(20, 5))
 
         preset_instructions = [
             "Make the comments more concise",
@@ -59,25 +66,50 @@ class Sidebar(ctk.CTkFrame):
             button_hover_color=Theme.BLUE_HOVER,
             dropdown_fg_color=Theme.FRAME_BG
         )
-        self.refinement_dropdown.grid(row=6, column=0, padx=20, pady=5, sticky="ew")
+        self.refinement_dropdown.grid(row=7, column=0, padx=20, pady=5, sticky="ew")
         self.refinement_dropdown.set("Select preset...")
 
         self.refinement_entry = ctk.CTkEntry(self,
                                             placeholder_text="e.g., Make comments concise",
                                             fg_color=Theme.TEXT_INPUT_BG,
                                             text_color=Theme.TEXT)
-        self.refinement_entry.grid(row=7, column=0, padx=20, pady=5, sticky="ew")
+        self.refinement_entry.grid(row=8, column=0, padx=20, pady=5, sticky="ew")
         self.refinement_entry.insert(0, "Make the comments more concise")
 
         self.refine_button = ctk.CTkButton(self, text="Refine Last Output",
                                            command=self.callbacks.get("refine_last_output"),
                                            fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER)
-        self.refine_button.grid(row=8, column=0, padx=20, pady=10)
+        self.refine_button.grid(row=9, column=0, padx=20, pady=10)
+
+        self.delta_refinement_switch = ctk.CTkSwitch(self, text="Edit-based refinement",
+                                                     progress_color=Theme.BLUE)
+        self.delta_refinement_switch.grid(row=10, column=0, padx=20, pady=(0, 10), sticky="w")
+        if env_flag("DELTA_REFINEMENT", True):
+            self.delta_refinement_switch.select()
 
         self.export_button = ctk.CTkButton(self, text="Export Output",
                                           command=self.callbacks.get("export_output"),
                                           fg_color=Theme.GREEN, hover_color=Theme.GREEN_HOVER)
-        self.export_button.grid(row=9, column=0, padx=20, pady=10)
+        self.export_button.grid(row=11, column=0, padx=20, pady=10)
+
+        self.metrics_button = ctk.CTkButton(self, text="Metrics",
+                                            command=self.callbacks.get("show_metrics"),
+                                            fg_color=Theme.BLUE, hover_color=Theme.BLUE_HOVER)
+        self.metrics_button.grid(row=12, column=0, padx=20, pady=10)
+
+        self.compare_button = ctk.CTkButton(self, text="Compare",
+                                            command=self.callbacks.get("show_diff"),
+                                            fg_color=Theme.GREEN, hover_color=Theme.GREEN_HOVER)
+        self.compare_button.grid(row=13, column=0, padx=20, pady=10)
+
+        self.job_queue = JobQueueView(self,
+                                      on_cancel=self.callbacks.get("cancel_job"),
+                                      on_cancel_all=self.callbacks.get("cancel_all_jobs"))
+        self.job_queue.grid(row=14, column=0, padx=20, pady=(10, 20), sticky="new")
+
+        self.status_label = ctk.CTkLabel(self, text="Loading model...", font=("Consolas", 10),
+                                         text_color="#6c7a89", wraplength=180, justify="left")
+        self.status_label.grid(row=15, column=0, padx=20, pady=(0, 10), sticky="w")
 
     def get_refinement_instruction(self) -> str:
         instruction = self.refinement_entry.get().strip()
@@ -87,6 +119,15 @@ class Sidebar(ctk.CTkFrame):
             self.refinement_entry.insert(0, instruction)
         return instruction
 
+    def delta_refinement_enabled(self) -> bool:
+        return bool(self.delta_refinement_switch.get())
+
+    def set_status(self, text: str, color: str = Theme.TEXT):
+        self.status_label.configure(text=text, text_color=color)
+
+    def fan_out_enabled(self) -> bool:
+        return bool(self.fan_out_switch.winfo_manager() and self.fan_out_switch.get())
+
     def set_buttons_state(self, state: str):
         try:
             self.add_comments_button.configure(state=state)
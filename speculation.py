@@ -0,0 +1,201 @@
+# speculation.py
+# Opt-in speculative precompute: while the app is idle, run the actions the user most often picks
+# next and keep the results in a small cache, so clicking one of them completes immediately.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+from config import data_dir
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ClickStats:  # Per-user counts of which action/instruction was chosen, by context
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.counts = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    self.counts = json.load(file)
+            except (OSError, ValueError):
+                self.counts = {}
+
+    @staticmethod
+    def open_default() -> "ClickStats":
+        try:
+            return ClickStats(os.path.join(data_dir(), "click_stats.json"))
+        except OSError:
+            return ClickStats()
+
+    def record(self, context: str, choice: str):
+        choices = self.counts.setdefault(context, {})
+        choices[choice] = choices.get(choice, 0) + 1
+        self._save()
+
+    def likely(self, context: str, top_k: int = 1, min_share: float = 0.3, min_total: int = 3) -> List[str]:
+        """The top_k choices that made up at least min_share of the clicks in context, most frequent first."""
+        choices = self.counts.get(context, {})
+        total = sum(choices.values())
+        if total < min_total:
+            return []
+        ranked = sorted(choices.items(), key=lambda item: item[1], reverse=True)
+        return [choice for choice, count in ranked[:top_k] if count / total >= min_share]
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(self.counts, file)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class _Run:  # Handed to speculative work in place of a Job; cancelled when superseded or the app gets busy
+    def __init__(self, speculator: "Speculator", kind: str, generation: int):
+        self._speculator = speculator
+        self._kind = kind
+        self._generation = generation
+
+    @property
+    def cancelled(self) -> bool:
+        return self._speculator._generations.get(self._kind, 0) != self._generation or self._speculator.busy()
+
+    def charge(self):
+        """before_attempt hook for every API request; raises BudgetExhausted once the hour's budget is spent."""
+        self._speculator._charge()
+
+
+class Speculator:
+    """Runs candidates one at a time on its own thread, only after idle_seconds without explicit
+    activity and while busy() is false; a running candidate is abandoned as soon as busy() turns
+    true. At most budget_per_hour requests are made per rolling hour.
+
+    Candidates are (key, fn) pairs where key is a tuple whose first item is its kind (e.g.
+    "action" or "refine") and fn(run) returns the text, polling run.cancelled like a job would.
+    The budget counts requests, retries included, so fn passes run.charge as before_attempt to
+    every client call; a candidate that runs out of budget part way starts over once there is more.
+    """
+
+    def __init__(self, busy: Callable[[], bool], budget_per_hour: int = 30, max_entries: int = 8,
+                 idle_seconds: float = 3.0):
+        self.busy = busy
+        self.budget_per_hour = budget_per_hour
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self.started = 0
+        self.completed = 0
+        self.hits = 0
+        self._results = OrderedDict()
+        self._pending = []
+        self._generations = {}
+        self._spent = deque()
+        self._last_activity = time.monotonic()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name="speculator", daemon=True)
+        self._thread.start()
+
+    def speculate(self, candidates: Sequence[Tuple[Hashable, Callable]]):
+        """Queue candidates of one kind, replacing any still-pending candidates of that kind."""
+        with self._cond:
+            kinds = {key[0] for key, _ in candidates}
+            self._pending = [c for c in self._pending if c[0][0] not in kinds]
+            self._pending.extend(c for c in candidates if c[0] not in self._results)
+            self._cond.notify()
+
+    def take(self, key: Hashable) -> Optional[str]:
+        with self._cond:
+            result = self._results.pop(key, None)
+            if result is not None:
+                self.hits += 1
+            return result
+
+    def invalidate(self, kind: str):
+        """Drop results and pending candidates of kind and abandon a running one, e.g. when the input changes."""
+        with self._cond:
+            self._generations[kind] = self._generations.get(kind, 0) + 1
+            for key in [key for key in self._results if key[0] == kind]:
+                del self._results[key]
+            self._pending = [c for c in self._pending if c[0][0] != kind]
+
+    def note_activity(self):
+        with self._cond:
+            self._last_activity = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"started": self.started, "completed": self.completed, "hits": self.hits,
+                    "requests": len(self._spent), "cached": len(self._results)}
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                candidate = self._next_candidate()
+                if candidate is None:
+                    continue
+                (key, fn), run = candidate
+            exhausted = False
+            try:
+                result = fn(run)
+            except BudgetExhausted:
+                result, exhausted = None, True
+            except Exception:
+                result = None
+            with self._cond:
+                if exhausted and self._generations.get(key[0], 0) == run._generation:
+                    self._pending.insert(0, (key, fn))
+                elif result and not run.cancelled:
+                    self.completed += 1
+                    self._results[key] = result
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+                elif run.cancelled and self._generations.get(key[0], 0) == run._generation:
+                    # Abandoned only because the app got busy: try again at the next idle period
+                    self._pending.insert(0, (key, fn))
+
+    def _next_candidate(self):
+        # Called with the lock held; waits (releasing it) until a candidate may start
+        if not self._pending:
+            self._cond.wait()
+            return None
+        now = time.monotonic()
+        idle_at = self._last_activity + self.idle_seconds
+        if now < idle_at:
+            self._cond.wait(idle_at - now)
+            return None
+        if self.busy():
+            self._cond.wait(0.5)
+            return None
+        if not self._budget_left(now):
+            self._cond.wait(3600 - (now - self._spent[0]))
+            return None
+        key, fn = self._pending.pop(0)
+        self.started += 1
+        return (key, fn), _Run(self, key[0], self._generations.get(key[0], 0))
+
+    def _budget_left(self, now: float) -> bool:
+        # Called with the lock held
+        while self._spent and now - self._spent[0] > 3600:
+            self._spent.popleft()
+        return len(self._spent) < self.budget_per_hour
+
+    def _charge(self):
+        with self._cond:
+            now = time.monotonic()
+            if not self._budget_left(now):
+                raise BudgetExhausted()
+            self._spent.append(now)
@@ -16,4 +16,10 @@ class Theme:
     # Button Hover Colors
     BLUE_HOVER = "#5295c7"
     GREEN_HOVER = "#81a868"
-    YELLOW_HOVER = "#c4a569"
\ No newline at end of file
+    YELLOW_HOVER = "#c4a569"
+
+    # Diff highlighting
+    DIFF_DELETE_BG = "#4b2a2e"
+    DIFF_INSERT_BG = "#2e4230"
+    DIFF_CHANGE_BG = "#3e3a2a"
+    DIFF_TOKEN_BG = "#6b5a2e"
@@ -0,0 +1,116 @@
+# validation.py
+# Local checks on model output before it reaches the editor or history: a markdown fence around the
+# whole response is removed, Python is parsed and compiled, and an optional formatter and linter run
+# on a temporary copy.
+
+import ast
+import os
+import shlex
+import subprocess
+import tempfile
+from typing import List, Optional, Tuple
+
+from chunker import is_python
+from config import env_float
+from patching import strip_fences
+
+# Tool output beyond this is cut, both for the status line and the corrective prompt
+MAX_PROBLEM_CHARS = 2000
+
+
+class ValidationError(Exception):
+    pass
+
+
+def expects_python(source: str, filename: Optional[str] = None) -> bool:
+    # Only hold output to Python syntax when the code it came from was valid Python itself
+    if not is_python(source, filename):
+        return False
+    try:
+        ast.parse(source)
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+
+def python_problems(code: str, filename: str = "<output>") -> List[str]:
+    try:
+        compile(ast.parse(code, filename), filename, "exec")
+    except SyntaxError as e:
+        return [f"SyntaxError: {e.msg} (line {e.lineno})"]
+    except ValueError as e:
+        return [f"ValueError: {e}"]
+    return []
+
+
+class OutputValidator:
+    """Checks one output; check() returns the (possibly formatted) text and a list of problems.
+
+    lint_command and format_command are command lines run on a temporary copy of the output, with
+    {file} replaced by its path (appended when absent). The formatter rewrites the file in place
+    and its result is kept when it exits cleanly; a linter exiting non-zero reports its output as a
+    problem.
+    """
+
+    def __init__(self, lint_command: Optional[str] = None, format_command: Optional[str] = None,
+                 timeout: float = 30):
+        self.lint_command = lint_command
+        self.format_command = format_command
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> "OutputValidator":
+        return cls(os.environ.get("LINT_COMMAND") or None, os.environ.get("FORMAT_COMMAND") or None,
+                   env_float("VALIDATION_COMMAND_TIMEOUT", 30))
+
+    def check(self, text: str, python: bool, suffix: str = ".py", source: str = "") -> Tuple[str, List[str]]:
+        unwrapped = strip_fences(text, source)
+        # Python keeps its fences unless removing them is what makes it parse
+        if unwrapped != text and (not python or (python_problems(text) and not python_problems(unwrapped))):
+            text = unwrapped
+        if not text.strip():
+            return text, ["The response contained no code."]
+        if python:
+            problems = python_problems(text)
+            if problems:
+                # The external tools would only repeat the syntax error
+                return text, problems
+        if not self.lint_command and not self.format_command:
+            return text, []
+
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix="codeassistant-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(text)
+            problems = []
+            if self.format_command:
+                code, output = self._run(self.format_command, path)
+                if code == 0:
+                    with open(path, "r", encoding="utf-8") as file:
+                        text = file.read()
+                else:
+                    problems.append(f"Formatter failed: {output}")
+            if self.lint_command and not problems:
+                code, output = self._run(self.lint_command, path)
+                if code != 0:
+                    problems.append(output.replace(path, "output") or f"Linter exited with status {code}")
+            return text, problems
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _run(self, command: str, path: str) -> Tuple[int, str]:
+        args = shlex.split(command, posix=os.name != "nt")
+        if any("{file}" in arg for arg in args):
+            args = [arg.replace("{file}", path) for arg in args]
+        else:
+            args.append(path)
+        try:
+            result = subprocess.run(args, capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            # A missing or hanging tool is a configuration problem, not a fault in the output
+            return 0, str(e)
+        output = (result.stdout + result.stderr).strip()
+        return result.returncode, output[:MAX_PROBLEM_CHARS]
@@ -0,0 +1,96 @@
+# workspace.py
+# Tabs for working on several documents at once. Only the active tab owns the editor and history
+# widgets; inactive tabs are reduced to a TabState (texts compressed when large, history in the store).
+
+import itertools
+import zlib
+from typing import Callable, List, Optional
+
+import customtkinter as ctk
+from theme import Theme
+
+
+def _pack(text: str):
+    # Texts above this size are kept zlib-compressed while their tab is in the background
+    if len(text) > 64 * 1024:
+        return zlib.compress(text.encode("utf-8"), 1)
+    return text
+
+
+def _unpack(value) -> str:
+    return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+
+
+class TabState:
+    """Everything a document needs while its tab is inactive.
+
+    display_job is the job whose result the tab's output follows; its other in-flight jobs keep
+    running on the shared scheduler and report back to the tab when they finish.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, title: str, output_text: str = ""):
+        self.id = next(TabState._ids)
+        self.title = title
+        self._input = ""
+        self._output = _pack(output_text)
+        self.input_has_placeholder = True
+        self.input_file_path = None
+        self.session_id = None
+        self.display_job = None
+        self.stream_started = False
+        self.jobs = set()
+        self.unseen = False  # finished work arrived while the tab was in the background
+
+    @property
+    def input_text(self) -> str:
+        return _unpack(self._input)
+
+    @input_text.setter
+    def input_text(self, text: str):
+        self._input = _pack(text)
+
+    @property
+    def output_text(self) -> str:
+        return _unpack(self._output)
+
+    @output_text.setter
+    def output_text(self, text: str):
+        self._output = _pack(text)
+
+
+class TabBar(ctk.CTkFrame):  # Tab selector with new/close buttons above the editors
+    def __init__(self, parent, on_select: Callable[[int], None], on_new: Callable[[], None],
+                 on_close: Callable[[], None]):
+        super().__init__(parent, fg_color="transparent")
+        self.on_select = on_select
+        self._labels = {}
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tabs = ctk.CTkSegmentedButton(self, values=[""], command=self._on_selected,
+                                           selected_color=Theme.BLUE, selected_hover_color=Theme.BLUE_HOVER,
+                                           unselected_color=Theme.FRAME_BG, text_color=Theme.TEXT)
+        self.tabs.grid(row=0, column=0, sticky="w")
+        ctk.CTkButton(self, text="+", width=28, height=24, command=on_new,
+                      fg_color=Theme.GREEN, hover_color=Theme.GREEN_HOVER).grid(row=0, column=1, padx=(5, 0))
+        ctk.CTkButton(self, text="x", width=28, height=24, command=on_close,
+                      fg_color=Theme.YELLOW, hover_color=Theme.YELLOW_HOVER).grid(row=0, column=2, padx=(5, 0))
+
+    def update_tabs(self, tabs: List[TabState], active: Optional[TabState]):
+        # Segmented button values must be unique, so repeated titles get a counter
+        self._labels = {}
+        for tab in tabs:
+            label = tab.title + (" *" if tab.unseen else "")
+            while label in self._labels:
+                label += "'"
+            self._labels[label] = tab.id
+        self.tabs.configure(values=list(self._labels))
+        for label, tab_id in self._labels.items():
+            if active is not None and tab_id == active.id:
+                self.tabs.set(label)
+
+    def _on_selected(self, label: str):
+        tab_id = self._labels.get(label)
+        if tab_id is not None:
+            self.on_select(tab_id)